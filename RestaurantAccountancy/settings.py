@@ -49,6 +49,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.instrumentation.InstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'RestaurantAccountancy.urls'
@@ -75,11 +76,42 @@ WSGI_APPLICATION = 'RestaurantAccountancy.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql uses the DB_* settings below (needs `pip install psycopg`); the default is a local SQLite file
+# in WAL mode, so exports and imports do not lock out staff editing prices in the admin. The SQLite backend
+# (utils.sqlite3) starts every atomic() block with BEGIN IMMEDIATE, read-only ones included: each takes the write
+# lock, so keep reads out of atomic() where they need not be consistent with a write.
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='restaurant_accountancy'),
+            'USER': config('DB_USER', default='postgres'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default=5432, cast=int),
+            # seconds a connection is kept open between requests
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'utils.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0, cast=int),
+        }
     }
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # milliseconds a writer waits for the write lock before "database is locked"
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=20000, cast=int),
+    # safe with WAL: a power loss can only lose the last commits, not corrupt the database
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 128 * 1024 * 1024,
 }
 
 # Password validation
@@ -124,6 +156,35 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "static_cdn", "media_root")
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "assets")
 ]
+# Background jobs (Menu import/export). 0 runs jobs inside the request that queued them.
+JOB_WORKERS = config('JOB_WORKERS', default=2, cast=int)
+# Seconds after which a running job is taken for one whose worker died, and is queued again.
+JOB_TIMEOUT = config('JOB_TIMEOUT', default=3600, cast=int)
+
+# Cost breakdowns and API responses. Use django.core.cache.backends.filebased.FileBasedCache with a directory as
+# CACHE_LOCATION to share the cache between processes.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='restaurant-accountancy'),
+        'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=20000, cast=int)},
+    }
+}
+
+# Seconds a cost breakdown stays cached. Entries are keyed on a version column of the product, so changes made in
+# any process make them stale at once.
+COST_CACHE_TIMEOUT = config('COST_CACHE_TIMEOUT', default=300, cast=int)
+
+# Seconds a rendered API response stays in the cache; price changes make it stale earlier.
+API_CACHE_TIMEOUT = config('API_CACHE_TIMEOUT', default=300, cast=int)
+# Comma separated tokens for API clients without a staff session (sent as "Authorization: Token <token>").
+API_TOKENS = [token for token in config('API_TOKENS', default='').split(',') if token]
+
+# Query/timing instrumentation of requests and signal receivers, shown at /admin/instrumentation/.
+INSTRUMENTATION_ENABLED = config('INSTRUMENTATION_ENABLED', default=False, cast=bool)
+INSTRUMENTATION_BUFFER_SIZE = config('INSTRUMENTATION_BUFFER_SIZE', default=500, cast=int)
+INSTRUMENTATION_N_PLUS_ONE_THRESHOLD = config('INSTRUMENTATION_N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
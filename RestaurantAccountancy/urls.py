@@ -16,12 +16,15 @@ Including another URLconf
 """
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, include
 
 from RestaurantAccountancy import settings
+from product.views import instrumentation_view
 
 urlpatterns = [
+    path('admin/instrumentation/', admin.site.admin_view(instrumentation_view), name='admin_instrumentation'),
     path('admin/', admin.site.urls),
+    path('api/', include('product.urls')),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
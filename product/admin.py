@@ -1,15 +1,51 @@
-import datetime
+import math
+import os
 
 from django.contrib import admin
 from django import forms
 from django.core.exceptions import ValidationError
 from django.db.models import Q
-from django.utils.html import format_html
+from django.http import JsonResponse, FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
 from jalali_date import date2jalali
 
-from utils.utils import import_from_excel, validate_excel, format_number, get_color, denormalizer
+from utils.cost_cache import get_breakdown
+from utils.cost_graph import get_cost_graph, RecipeCycleError
+from utils.current_prices import annotate_product_prices, annotate_sell_price_history
+from utils.text import normalize_name, PREFIX_END
+from utils.formats import get_importer, export_available
+from utils.importers import save_staged
+from utils.utils import format_number, get_color, persian_to_english_number
 from .models import PrimaryIngredient, MiddleIngredient, FinalProduct, PriceHistory, SellPriceHistory, \
-    FinalPriceHistory, Menu
+    FinalPriceHistory, Menu, Job
+
+
+class NormalizedNameSearchMixin:
+    """
+    Search on the indexed normalized_name column. Terms of substring_search_min_length characters or more match
+    anywhere in the name; shorter ones, which would match most names anywhere, use a prefix range lookup that can
+    use the index.
+    """
+    normalized_name_lookup = 'normalized_name'
+    substring_search_min_length = 3
+
+    def get_extra_search_query(self, search_term):
+        return Q()
+
+    def get_search_results(self, request, queryset, search_term):
+        term = normalize_name(search_term)
+        if not term:
+            return queryset, False
+        lookup, extra = self.normalized_name_lookup, self.get_extra_search_query(search_term)
+        if len(term) >= self.substring_search_min_length:
+            # also finds the names starting with the term
+            results = queryset.filter(Q(**{f'{lookup}__contains': term}) | extra)
+        else:
+            results = queryset.filter(Q(**{f'{lookup}__gte': term, f'{lookup}__lt': term + PREFIX_END}) | extra)
+        return results, False
 
 
 class PriceHistoryInLine(admin.StackedInline):
@@ -33,34 +69,39 @@ class MiddleIngredientInLine(admin.TabularInline):
     extra = 0
 
 
-class PrimaryIngredientAdmin(admin.ModelAdmin):
+class PrimaryIngredientAdminForm(forms.ModelForm):
+    class Meta:
+        model = PrimaryIngredient
+        fields = '__all__'
+
+    def clean_related_ingredient(self):
+        middle_ingredients = self.cleaned_data['related_ingredient']
+        if self.instance.pk:
+            try:
+                get_cost_graph().check_recipe(self.instance.pk, [i.pk for i in middle_ingredients])
+            except RecipeCycleError as e:
+                raise ValidationError(str(e))
+        return middle_ingredients
+
+
+class PrimaryIngredientAdmin(NormalizedNameSearchMixin, admin.ModelAdmin):
+    form = PrimaryIngredientAdminForm
     list_display = ['name', 'get_last_price']
     inlines = [PriceHistoryInLine]
     autocomplete_fields = ('related_ingredient',)
 
     def get_last_price(self, obj):
-        return format_number((int(obj.price_history.first().unit_price))) if obj.price_history.exists() else None
+        return format_number(obj.current_price) if obj.current_price is not None else None
 
     get_last_price.short_description = 'آخرین قیمت'
     search_fields = ['name']
 
     def calculate_final_price(self, middle_ingredients: [MiddleIngredient]):
-        price = 0
-        for i in middle_ingredients:
-            price += int(
-                float(PriceHistory.objects.filter(ingredient=i.base_ingredient).first().unit_price) * i.unit_amount)
-        return price
-
-    def get_search_results(self, request, queryset, search_term):
-        new_search_term = denormalizer(search_term)
-
-        queryset = queryset.filter(Q(name__icontains=new_search_term) | Q(name__icontains=search_term))
-        return queryset, False
+        return get_cost_graph().cost_of(i.pk for i in middle_ingredients)
 
     def save_model(self, request, obj, form, change):
         form.cleaned_data.pop('price_history', None)
         super().save_model(request, obj, form, change)
-        print(form.cleaned_data)
         if form.cleaned_data.get('related_ingredient'):
             price = self.calculate_final_price(form.cleaned_data['related_ingredient'])
             PriceHistory.objects.create(ingredient=obj, unit_price=price)
@@ -72,18 +113,12 @@ class MiddleIngredientAdminForm(forms.ModelForm):
         fields = '__all__'
 
 
-class MiddleIngredientAdmin(admin.ModelAdmin):
+class MiddleIngredientAdmin(NormalizedNameSearchMixin, admin.ModelAdmin):
+    normalized_name_lookup = 'base_ingredient__normalized_name'
     autocomplete_fields = ['base_ingredient']
     form = MiddleIngredientAdminForm
     search_fields = ('base_ingredient__name',)
 
-    def get_search_results(self, request, queryset, search_term):
-        new_search_term = denormalizer(search_term)
-
-        queryset = queryset.filter(
-            Q(base_ingredient__name__icontains=new_search_term) | Q(base_ingredient__name__icontains=search_term))
-        return queryset, False
-
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
         form.base_fields['type'].initial = 'f'
@@ -125,42 +160,118 @@ class FinalPriceHistoryInLine(admin.StackedInline):
         return False
 
 
-class FinalProductAdmin(admin.ModelAdmin):
+class ProfitListFilter(admin.SimpleListFilter):
+    title = 'سود و زیان'
+    parameter_name = 'profit'
+    low_margin_percent = 20
+
+    def lookups(self, request, model_admin):
+        return [
+            ('loss', 'زیان ده'),
+            ('low', f'حاشیه سود کمتر از {self.low_margin_percent} درصد'),
+            ('profit', 'سود ده'),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'loss':
+            return queryset.filter(profit__lt=0)
+        if self.value() == 'low':
+            return queryset.filter(margin__gte=0, margin__lt=self.low_margin_percent)
+        if self.value() == 'profit':
+            return queryset.filter(profit__gt=0)
+
+
+class CostAsOfForm(forms.Form):
+    FREQUENCY_CHOICES = [('D', 'روزانه'), ('W', 'هفتگی'), ('MS', 'ماهانه')]
+    MAX_DATES = 120
+
+    start = forms.DateField(label='از تاریخ', widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(label='تا تاریخ', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    frequency = forms.ChoiceField(label='فاصله', choices=FREQUENCY_CHOICES, initial='D')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and end < start:
+            raise ValidationError('تاریخ پایان باید بعد از تاریخ شروع باشد')
+        if start and end and (end - start).days > self.MAX_DATES * 31:
+            raise ValidationError('بازه انتخاب شده بیش از حد طولانی است')
+        return cleaned_data
+
+
+class FinalProductAdmin(NormalizedNameSearchMixin, admin.ModelAdmin):
     inlines = [SellPriceHistoryInLine, FinalPriceHistoryInLine]
     list_display = ('name', 'get_last_sell_price', 'get_last_final_price', 'get_profit')
+    list_filter = (ProfitListFilter,)
     search_fields = ('name',)
     autocomplete_fields = ('ingredients',)
-
-    def get_search_results(self, request, queryset, search_term):
-        new_search_term = denormalizer(search_term)
-
-        queryset = queryset.filter(Q(name__icontains=search_term) | Q(name__icontains=new_search_term))
-        return queryset, False
+    readonly_fields = ('get_cost_breakdown',)
+    change_list_template = 'admin/product/finalproduct/change_list.html'
+
+    def get_queryset(self, request):
+        return annotate_product_prices(super().get_queryset(request))
+
+    def get_urls(self):
+        return [
+            path('cost-as-of/', self.admin_site.admin_view(self.cost_as_of_view),
+                 name='product_finalproduct_cost_as_of'),
+        ] + super().get_urls()
+
+    def cost_as_of_view(self, request):
+        if not self.has_view_permission(request):
+            raise Http404
+        from utils.costing import menu_cost_as_of, menu_cost_between
+
+        form = CostAsOfForm(request.GET or None)
+        dates, rows = [], []
+        if form.is_valid():
+            start, end = form.cleaned_data['start'], form.cleaned_data['end']
+            costs = menu_cost_between(start, end, form.cleaned_data['frequency']) if end else menu_cost_as_of([start])
+            costs = costs.iloc[:CostAsOfForm.MAX_DATES]
+            dates = [date2jalali(timestamp.date()) for timestamp in costs.index]
+            names = dict(FinalProduct.objects.values_list('id', 'name'))
+            rows = [(names[product_id], [None if math.isnan(cost) else format_number(int(cost))
+                                         for cost in costs[product_id]]) for product_id in costs.columns]
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'قیمت محاسبه شده محصولات در تاریخ های گذشته',
+            'form': form,
+            'dates': dates,
+            'rows': rows,
+        }
+        return TemplateResponse(request, 'admin/product/finalproduct/cost_as_of.html', context)
 
     def get_last_final_price(self, obj):
-        if FinalPriceHistory.objects.filter(final_product=obj, sell_price__gt=0).first():
-            return format_number(
-                FinalPriceHistory.objects.filter(final_product=obj, sell_price__gt=0).first().sell_price)
+        if obj.last_final_price:
+            return format_number(obj.last_final_price)
 
     def get_last_sell_price(self, obj):
-        if SellPriceHistory.objects.filter(final_product=obj, sell_price__gt=0).first():
-            return format_number(
-                SellPriceHistory.objects.filter(final_product=obj, sell_price__gt=0).first().sell_price)
+        if obj.last_sell_price:
+            return format_number(obj.last_sell_price)
 
     def get_profit(self, obj):
-        final_price_history_qs = FinalPriceHistory.objects.filter(final_product=obj, sell_price__gt=0)
-        sell_price_history_qs = SellPriceHistory.objects.filter(final_product=obj, sell_price__gt=0)
-        if final_price_history_qs.exists() and sell_price_history_qs.exists():
-            profit = final_price_history_qs.first().sell_price - sell_price_history_qs.first().sell_price
-            color = get_color(profit)
-            return format_html('<span style="color:{};">{}</span>', color, format_number(profit))
+        if obj.profit is not None:
+            color = get_color(obj.profit)
+            return format_html('<span style="color:{};">{}</span>', color, format_number(obj.profit))
+
+    def get_cost_breakdown(self, obj):
+        if obj.pk:
+            return format_html_join(format_html('<br>'), '{}: {} × {} = {}', (
+                (ingredient['name'], ingredient['unit_amount'], format_number(ingredient['unit_price'] or 0),
+                 format_number(ingredient['cost'])) for ingredient in get_breakdown(obj.pk)['ingredients']))
 
     get_last_final_price.short_description = 'قیمت ثبت شده در منو'
     get_last_sell_price.short_description = 'قیمت محاسبه شده'
+    get_cost_breakdown.short_description = 'ریز قیمت مواد اولیه'
     get_profit.short_description = 'سود محاسبه شده'
+    get_last_final_price.admin_order_field = 'last_final_price'
+    get_last_sell_price.admin_order_field = 'last_sell_price'
+    get_profit.admin_order_field = 'profit'
 
 
-class PriceHistoryAdmin(admin.ModelAdmin):
+class PriceHistoryAdmin(NormalizedNameSearchMixin, admin.ModelAdmin):
+    normalized_name_lookup = 'ingredient__normalized_name'
     fields = ('unit_price', 'ingredient' 'get_unit_price')
     readonly_fields = ('ingredient', 'get_unit_price')
     search_fields = ('ingredient__name', 'unit_price')
@@ -168,11 +279,9 @@ class PriceHistoryAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
     list_display = ('get_date', 'ingredient', 'get_unit_price')
 
-    def get_search_results(self, request, queryset, search_term):
-        new_search_term = denormalizer(search_term)
-
-        queryset = queryset.filter(Q(ingredient__name__icontains=search_term) | Q(unit_price=search_term) | Q(ingredient__name__icontains=new_search_term) | Q(unit_price=new_search_term))
-        return queryset, False
+    def get_extra_search_query(self, search_term):
+        price = persian_to_english_number(search_term).replace(',', '').strip()
+        return Q(unit_price=int(price)) if price.isdigit() else Q()
 
     def get_date(self, obj):
         return date2jalali(obj.created_at.date())
@@ -191,35 +300,128 @@ class MenuForm(forms.ModelForm):
         model = Menu
         fields = '__all__'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # formats whose libraries are not installed (e.g. Parquet without pyarrow) are not offered
+        field = self.fields['export_format']
+        field.choices = [(value, label) for value, label in field.choices if export_available(value)]
+
     def clean(self):
-        print(self.cleaned_data)
-        excel_file = self.cleaned_data.get('imported_file')
-        if excel_file:
+        imported_file = self.cleaned_data.get('imported_file')
+        self.staged_rows = None
+        if imported_file:
+            # parsed once here; the import job commits these rows instead of reading the file again
             try:
-                validate_excel(excel_file)
-            except Exception as e:
-                raise ValidationError(e)
+                self.staged_rows = get_importer(imported_file.name)(imported_file)
+            except ValidationError as e:
+                raise ValidationError({'imported_file': e.messages})
         super().clean()
 
 
+class JobInLine(admin.TabularInline):
+    model = Job
+    extra = 0
+    fields = ('status', 'get_progress', 'started_at', 'finished_at', 'error')
+    readonly_fields = fields
+
+    @admin.display(description='درصد پیشرفت')
+    def get_progress(self, obj):
+        return format_html('<a href="{}">{}%</a>', reverse('admin:product_job_change', args=[obj.pk]), obj.progress)
+
+    def has_add_permission(self, request, obj):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 class MenuAdmin(admin.ModelAdmin):
     readonly_fields = ('file',)
     list_filter = ('created_at',)
     form = MenuForm
+    inlines = [JobInLine]
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if form.staged_rows:
+            save_staged(obj, form.staged_rows)
+        self.message_user(request, 'ورود و خروج اطلاعات در پس زمینه انجام می شود، پیشرفت آن را در بخش کار ها دنبال کنید')
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('menu', 'status', 'get_progress', 'get_duration', 'get_download')
+    list_filter = ('status', 'created_at')
+    fields = ('menu', 'status', 'get_progress', 'started_at', 'finished_at', 'get_duration', 'error', 'get_download')
+    readonly_fields = fields
+    change_form_template = 'admin/product/job/change_form.html'
+
+    def get_urls(self):
+        return [
+            path('<path:object_id>/progress/', self.admin_site.admin_view(self.progress_view),
+                 name='product_job_progress'),
+            path('<path:object_id>/download/', self.admin_site.admin_view(self.download_view),
+                 name='product_job_download'),
+        ] + super().get_urls()
+
+    def get_job(self, request, object_id):
+        job = get_object_or_404(Job.objects.select_related('menu'), pk=object_id)
+        if not self.has_view_permission(request, job):
+            raise Http404
+        return job
+
+    def progress_view(self, request, object_id):
+        job = self.get_job(request, object_id)
+        return JsonResponse({
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'progress': job.progress,
+            'error': job.error,
+            'download_url': self.get_download_url(job),
+        })
+
+    def download_view(self, request, object_id):
+        job = self.get_job(request, object_id)
+        if not self.get_download_url(job):
+            raise Http404
+        return FileResponse(job.menu.file.open('rb'), as_attachment=True, filename=os.path.basename(job.menu.file.name))
+
+    def get_download_url(self, job):
+        if job.status == Job.StatusChoices.DONE and job.menu.file:
+            return reverse('admin:product_job_download', args=[job.pk])
+
+    @admin.display(description='درصد پیشرفت')
+    def get_progress(self, obj):
+        return format_html('<progress value="{}" max="100"></progress> {}%', obj.progress, obj.progress)
+
+    @admin.display(description='مدت زمان')
+    def get_duration(self, obj):
+        if obj.duration is not None:
+            return str(obj.duration).split('.')[0]
+
+    @admin.display(description='فایل خروجی')
+    def get_download(self, obj):
+        url = self.get_download_url(obj)
+        if url:
+            return format_html('<a href="{}">دانلود</a>', url)
+
+    def has_add_permission(self, request):
+        return False
 
+    def has_change_permission(self, request, obj=None):
+        return False
 
-class SellPriceHistoryAdmin(admin.ModelAdmin):
+
+class SellPriceHistoryAdmin(NormalizedNameSearchMixin, admin.ModelAdmin):
+    normalized_name_lookup = 'final_product__normalized_name'
     list_display = ('get_name', 'get_final_price', 'get_sell_price', 'get_profit', 'get_date')
     fields = ('get_name', 'get_final_price', 'sell_price', 'get_profit', 'get_date')
     readonly_fields = ('get_name', 'get_final_price', 'get_profit', 'sell_price', 'get_date', 'get_sell_price')
-    list_filter = ('created_at',)
+    list_filter = ('created_at', ProfitListFilter)
     search_fields = ('final_product__name',)
+    list_select_related = ('final_product',)
 
-    def get_search_results(self, request, queryset, search_term):
-        new_search_term = denormalizer(search_term)
-
-        queryset = queryset.filter(Q(final_product__name__icontains=search_term) | Q(final_product__name__icontains=new_search_term))
-        return queryset, False
+    def get_queryset(self, request):
+        return annotate_sell_price_history(super().get_queryset(request))
 
     @admin.display(description='نام')
     def get_name(self, obj):
@@ -229,28 +431,20 @@ class SellPriceHistoryAdmin(admin.ModelAdmin):
     def get_date(self, obj):
         return date2jalali(obj.created_at.date())
 
-    @admin.display(description='قیمت داخل منو')
+    @admin.display(description='قیمت داخل منو', ordering='menu_price')
     def get_final_price(self, obj):
-        final_price_queryset = FinalPriceHistory.objects.filter(final_product=obj.final_product,
-                                                                created_at__lte=obj.created_at + datetime.timedelta(
-                                                                    seconds=3))
-        if final_price_queryset.first():
-            return format_number(final_price_queryset.first().sell_price)
+        if obj.menu_price is not None:
+            return format_number(obj.menu_price)
 
+    @admin.display(ordering='sell_price')
     def get_sell_price(self, obj):
         return format_number(obj.sell_price)
 
-    @admin.display(description='سود و ضرر')
+    @admin.display(description='سود و ضرر', ordering='profit')
     def get_profit(self, obj):
-        final_price_queryset = FinalPriceHistory.objects.filter(final_product=obj.final_product,
-                                                                sell_price__gt=0,
-                                                                created_at__lte=obj.created_at + datetime.timedelta(
-                                                                    seconds=3))
-
-        if final_price_queryset:
-            profit = final_price_queryset.first().sell_price - obj.sell_price
-            color = get_color(profit)
-            return format_html('<span style="color:{};">{}</span>', color, format_number(profit))
+        if obj.profit is not None:
+            color = get_color(obj.profit)
+            return format_html('<span style="color:{};">{}</span>', color, format_number(obj.profit))
 
     def has_add_permission(self, request):
         return False
@@ -262,3 +456,4 @@ admin.site.register(FinalProduct, FinalProductAdmin)
 admin.site.register(PriceHistory, PriceHistoryAdmin)
 admin.site.register(SellPriceHistory, SellPriceHistoryAdmin)
 admin.site.register(Menu, MenuAdmin)
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from utils.benchmark import DEFAULT_SIZES, run_benchmarks, compare, load_baseline, save_baseline
+
+
+class Command(BaseCommand):
+    help = ('Generate synthetic data and measure wall time, query count and peak memory of the cost signals, '
+            'import, export and admin changelists. Everything is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_SIZES.items():
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=default, dest=name)
+        parser.add_argument('--baseline', default='benchmarks/baseline.json', help='Baseline JSON file.')
+        parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed slowdown / memory growth over the baseline (0.5 = 50%%).')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            report = run_benchmarks(**{name: options[name] for name in DEFAULT_SIZES})
+            transaction.set_rollback(True)
+        self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+
+        if options['save_baseline']:
+            save_baseline(report, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['baseline']}"))
+            return
+        try:
+            baseline = load_baseline(options['baseline'])
+        except FileNotFoundError:
+            self.stdout.write(self.style.WARNING(f"No baseline at {options['baseline']}, nothing to compare."))
+            return
+        if baseline.get('sizes') != report['sizes']:
+            self.stdout.write(self.style.WARNING('Baseline was recorded with different data sizes.'))
+        regressions = compare(report, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
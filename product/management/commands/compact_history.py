@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from utils.compaction import HISTORY_TABLES, compact_history
+
+
+class Command(BaseCommand):
+    help = ('Move price history rows older than the retention window to the archive tables, keeping the last row of '
+            'every ingredient and product per day or week.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=90, help='Days of history kept at full resolution.')
+        parser.add_argument('--period', choices=['day', 'week'], default='day',
+                            help='Older rows are collapsed to the last row of each period.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows archived per transaction.')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to wait between chunks.')
+        parser.add_argument('--table', choices=list(HISTORY_TABLES), action='append',
+                            help='Only compact this table (repeatable).')
+
+    def handle(self, *args, **options):
+        for table in options['table'] or HISTORY_TABLES:
+            archived = compact_history(table, options['keep_days'], options['period'], options['chunk_size'],
+                                       options['pause'])
+            self.stdout.write(self.style.SUCCESS(f'{table}: {archived} rows archived.'))
@@ -0,0 +1,43 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.formats import get_importer
+from utils.importers import commit_rows, diff_report
+
+
+class Command(BaseCommand):
+    help = ('Import a price list (xlsx or CSV). Only the prices that differ from the current ones are written; with '
+            '--dry-run nothing is written and the changes it would make are listed instead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the price list.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Show new ingredients, changed prices and the products whose cost would move.')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as f:
+                rows = get_importer(options['path'])(f)
+        except (OSError, ValidationError) as e:
+            raise CommandError('\n'.join(getattr(e, 'messages', [str(e)])))
+
+        if not options['dry_run']:
+            new, changed, unchanged = commit_rows(rows)
+            self.stdout.write(self.style.SUCCESS(
+                f'{len(new)} new ingredients, {len(changed)} changed prices, {unchanged} unchanged rows.'))
+            return
+
+        report = diff_report(rows)
+        self.stdout.write(f"New ingredients ({len(report['new_ingredients'])}):")
+        for row in report['new_ingredients']:
+            self.stdout.write(f"  {row['name']} ({row['unit']}): {row['price']:,}")
+        self.stdout.write(f"Changed prices ({len(report['changed_prices'])}):")
+        for row in report['changed_prices']:
+            percent = f"{row['percent']:+.1f}%" if row['percent'] is not None else 'new price'
+            self.stdout.write(f"  {row['name']}: {row['old_price'] or 0:,} -> {row['new_price']:,} ({percent})")
+        self.stdout.write(f"Products whose cost moves ({len(report['products'])}):")
+        for row in report['products']:
+            profit = (f", profit {row['old_profit']:,} -> {row['new_profit']:,}"
+                      if row['old_profit'] is not None and row['new_profit'] is not None else '')
+            self.stdout.write(f"  {row['name']}: cost {row['old_cost']:,} -> {row['new_cost']:,}{profit}")
+        self.stdout.write(f"{report['unchanged']} unchanged rows. Dry run, nothing was written.")
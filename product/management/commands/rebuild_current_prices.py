@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from utils.current_prices import rebuild_current_prices
+
+
+class Command(BaseCommand):
+    help = 'Recompute the current price, cost, menu price and profit columns from the history tables.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ingredients, products = rebuild_current_prices()
+        self.stdout.write(self.style.SUCCESS(f'{ingredients} ingredients and {products} products rebuilt.'))
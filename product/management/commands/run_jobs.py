@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from utils.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued Menu import/export jobs from the database queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2, help='Seconds to wait between queue polls.')
+        parser.add_argument('--once', action='store_true', help='Run the jobs currently queued and exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            run_pending_jobs()
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,51 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from product.models import PrimaryIngredient, FinalProduct
+from utils.simulation import simulate
+from utils.text import normalize_name
+
+
+class Command(BaseCommand):
+    help = ('Simulate price changes without touching the database. The scenarios file is a JSON list of '
+            '{"name": ..., "factors": {ingredient: multiplier}, "prices": {ingredient: price}} where an ingredient '
+            'is an id or a part of its name.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', help='Path of the JSON scenarios file.')
+        parser.add_argument('--output', help='Write the cost and profit of every product in every scenario to CSV.')
+
+    def resolve(self, key):
+        if str(key).isdigit():
+            return [int(key)]
+        ids = list(PrimaryIngredient.objects.filter(normalized_name__contains=normalize_name(key)).values_list(
+            'id', flat=True))
+        if not ids:
+            raise CommandError(f'No ingredient matches "{key}".')
+        return ids
+
+    def expand(self, values):
+        return {ingredient_id: value for key, value in values.items() for ingredient_id in self.resolve(key)}
+
+    def handle(self, *args, **options):
+        with open(options['scenarios'], encoding='utf-8') as f:
+            scenarios = json.load(f)
+        for scenario in scenarios:
+            scenario['factors'] = self.expand(scenario.get('factors', {}))
+            scenario['prices'] = self.expand(scenario.get('prices', {}))
+
+        result = simulate(scenarios)
+        for row in result.summary():
+            self.stdout.write(f"{row['scenario']}: total cost {row['total_cost']:,.0f}, "
+                              f"{row['loss_making']} loss-making products")
+
+        if options['output']:
+            names = dict(FinalProduct.objects.values_list('id', 'name'))
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['scenario', 'product', 'cost', 'menu_price', 'profit'])
+                for row, scenario in enumerate(result.names):
+                    for column, product_id in enumerate(result.product_ids):
+                        writer.writerow([scenario, names[product_id], result.costs[row, column],
+                                         result.menu_prices[column], result.profits[row, column]])
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.models import PrimaryIngredient
+from utils.benchmark import generate_data
+from utils.stress import run_stress
+
+
+class Command(BaseCommand):
+    help = ('Run parallel admin-style price writers against back-to-back menu exports and report the write '
+            'throughput and "database is locked" errors. The history rows the run writes are deleted afterwards and '
+            'the current prices rebuilt; it only runs with --scratch, on a copy of the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help='Threads writing prices.')
+        parser.add_argument('--seconds', type=float, default=10.0, help='How long to run.')
+        parser.add_argument('--seed', action='store_true',
+                            help='Fill an empty database with synthetic ingredients and products first (kept).')
+        parser.add_argument('--scratch', action='store_true',
+                            help='Confirm the database is a scratch copy that the run may write to.')
+        parser.add_argument('--max-lock-errors', type=int, default=None,
+                            help='Fail when more lock errors than this happen.')
+
+    def handle(self, *args, **options):
+        if options['seed'] and not PrimaryIngredient.objects.exists():
+            generate_data(ingredients=100, recipes=100, ingredients_per_recipe=8, history_depth=2)
+        if not options['scratch']:
+            raise CommandError('The stress test writes to the database; run it with --scratch on a copy of it.')
+        try:
+            report = run_stress(options['writers'], options['seconds'], scratch=True)
+        except ValueError as e:
+            raise CommandError(f'{e} Run with --seed on an empty database.')
+        self.stdout.write(json.dumps(report, indent=2))
+
+        if options['max_lock_errors'] is not None and report['lock_errors'] > options['max_lock_errors']:
+            raise CommandError(f"{report['lock_errors']} lock errors.")
@@ -0,0 +1,146 @@
+# Generated by Django 5.0.1 on 2026-10-18 10:42
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FinalProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+                ('name', models.CharField(max_length=200, verbose_name='نام')),
+            ],
+            options={
+                'verbose_name': 'محصول نهایی',
+                'verbose_name_plural': 'محصولات نهایی',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Menu',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+                ('file', models.FileField(blank=True, editable=False, null=True, upload_to='', verbose_name='فایل خروجی گرفته شده')),
+                ('imported_file', models.FileField(blank=True, null=True, upload_to='', verbose_name='فایل ورودی قیمت ها')),
+            ],
+            options={
+                'verbose_name': 'ورودی و خروجی',
+                'verbose_name_plural': 'ورودی و خروجی ها',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MiddleIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+                ('unit_amount', models.FloatField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='نسبت مورد نیاز(عددی اعشاری بزرگ تر از صفر وارد کنید)')),
+                ('type', models.CharField(choices=[('p', 'محصول اولیه'), ('f', 'محصول نهایی')], default='p', max_length=15, verbose_name='نوع محصول مرتبط شده')),
+            ],
+            options={
+                'verbose_name': 'محصول میانی',
+                'verbose_name_plural': 'محصولات میانی',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Unit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+                ('title', models.CharField(max_length=20, verbose_name='واحد')),
+            ],
+            options={
+                'verbose_name': 'واحد',
+                'verbose_name_plural': 'واحد ها',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FinalPriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+                ('sell_price', models.PositiveIntegerField(verbose_name='قیمت داخل منو')),
+                ('final_product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='final_prices', to='product.finalproduct', verbose_name='محصول نهایی')),
+            ],
+            options={
+                'verbose_name': 'تاریخچه قیمت داخل منو',
+                'verbose_name_plural': 'تاریخچه قیمت های داخل منو',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='finalproduct',
+            name='ingredients',
+            field=models.ManyToManyField(related_name='final_products', to='product.middleingredient', verbose_name='مواد اولیه مورد نیاز'),
+        ),
+        migrations.CreateModel(
+            name='PrimaryIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+                ('name', models.CharField(max_length=250, verbose_name='نام')),
+                ('related_ingredient', models.ManyToManyField(blank=True, null=True, related_name='related_ingredient', to='product.middleingredient', verbose_name='ماده اولیه مرتبط')),
+                ('unit', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingredients', to='product.unit', verbose_name='واحد')),
+            ],
+            options={
+                'verbose_name': 'ماده اولیه',
+                'verbose_name_plural': 'مواد اولیه',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+                ('unit_price', models.CharField(max_length=200, verbose_name='قیمت واحد')),
+                ('signal_involved', models.BooleanField(default=True)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='product.primaryingredient', verbose_name='ماده اولیه')),
+            ],
+            options={
+                'verbose_name': 'تاریخچه قیمت',
+                'verbose_name_plural': 'تاریخچه قیمت ها',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='middleingredient',
+            name='base_ingredient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='middle_ingredients', to='product.primaryingredient', verbose_name='ماده اولیه'),
+        ),
+        migrations.CreateModel(
+            name='SellPriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+                ('sell_price', models.PositiveIntegerField(verbose_name='قیمت نهایی')),
+                ('final_product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sell_prices', to='product.finalproduct', verbose_name='محصول نهایی')),
+            ],
+            options={
+                'verbose_name': 'تاریخچه قیمت نهایی',
+                'verbose_name_plural': 'تاریخجه قیمت های نهایی',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-18 10:45
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخرین بروزرسانی')),
+                ('status', models.CharField(choices=[('q', 'در صف'), ('r', 'در حال اجرا'), ('d', 'انجام شده'), ('f', 'ناموفق')], default='q', max_length=1, verbose_name='وضعیت')),
+                ('progress', models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MaxValueValidator(100)], verbose_name='درصد پیشرفت')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='زمان شروع')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='زمان پایان')),
+                ('error', models.TextField(blank=True, verbose_name='خطا')),
+                ('menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='product.menu', verbose_name='ورودی و خروجی')),
+            ],
+            options={
+                'verbose_name': 'کار پس زمینه',
+                'verbose_name_plural': 'کار های پس زمینه',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.1 on 2026-10-18 10:46
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, BigIntegerField
+from django.db.models.functions import Cast
+
+
+def fill_current_prices(apps, schema_editor):
+    PrimaryIngredient = apps.get_model('product', 'PrimaryIngredient')
+    PriceHistory = apps.get_model('product', 'PriceHistory')
+    FinalProduct = apps.get_model('product', 'FinalProduct')
+    SellPriceHistory = apps.get_model('product', 'SellPriceHistory')
+    FinalPriceHistory = apps.get_model('product', 'FinalPriceHistory')
+
+    def last_product_price(model):
+        return Subquery(model.objects.filter(final_product=OuterRef('pk'), sell_price__gt=0).order_by(
+            '-created_at').values('sell_price')[:1])
+
+    PrimaryIngredient.objects.update(current_price=Cast(Subquery(
+        PriceHistory.objects.filter(ingredient=OuterRef('pk')).order_by('-created_at').values('unit_price')[:1]),
+        BigIntegerField()))
+    FinalProduct.objects.update(
+        current_cost=last_product_price(SellPriceHistory),
+        current_menu_price=last_product_price(FinalPriceHistory),
+        current_profit=last_product_price(FinalPriceHistory) - last_product_price(SellPriceHistory),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0002_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finalproduct',
+            name='current_cost',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='قیمت محاسبه شده'),
+        ),
+        migrations.AddField(
+            model_name='finalproduct',
+            name='current_menu_price',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='قیمت ثبت شده در منو'),
+        ),
+        migrations.AddField(
+            model_name='finalproduct',
+            name='current_profit',
+            field=models.IntegerField(blank=True, editable=False, null=True, verbose_name='سود محاسبه شده'),
+        ),
+        migrations.AddField(
+            model_name='primaryingredient',
+            name='current_price',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True, verbose_name='قیمت فعلی'),
+        ),
+        migrations.RunPython(fill_current_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.1 on 2026-10-18 10:48
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# a copy of utils.utils.persian_to_english_number, so the migration does not depend on the app code
+PERSIAN_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹', '0123456789')
+
+
+def clean_price(value):
+    value = str(value).translate(PERSIAN_DIGITS).replace('٬', '').replace(',', '').strip()
+    price = int(float(value))
+    if price < 0:
+        raise ValueError(value)
+    return price
+
+
+def clean_unit_prices(apps, schema_editor):
+    PriceHistory = apps.get_model('product', 'PriceHistory')
+    changed, invalid = [], []
+    for price_history in PriceHistory.objects.only('id', 'unit_price').iterator():
+        try:
+            price = str(clean_price(price_history.unit_price))
+        except (ValueError, OverflowError):
+            invalid.append(price_history.pk)
+            continue
+        if price != price_history.unit_price:
+            price_history.unit_price = price
+            changed.append(price_history)
+    if invalid:
+        raise ValueError(f'{len(invalid)} PriceHistory rows have a unit_price that is not a price, fix or delete them '
+                         f'and migrate again. ids: {invalid[:50]}')
+    PriceHistory.objects.bulk_update(changed, ['unit_price'], batch_size=500)
+
+
+def refresh_current_prices(apps, schema_editor):
+    PrimaryIngredient = apps.get_model('product', 'PrimaryIngredient')
+    PriceHistory = apps.get_model('product', 'PriceHistory')
+    PrimaryIngredient.objects.update(current_price=Subquery(
+        PriceHistory.objects.filter(ingredient=OuterRef('pk')).order_by('-created_at').values('unit_price')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_current_prices'),
+    ]
+
+    operations = [
+        migrations.RunPython(clean_unit_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pricehistory',
+            name='unit_price',
+            field=models.PositiveBigIntegerField(verbose_name='قیمت واحد'),
+        ),
+        migrations.RunPython(refresh_current_prices, migrations.RunPython.noop),
+    ]
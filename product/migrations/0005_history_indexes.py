@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0004_numeric_unit_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='finalpricehistory',
+            index=models.Index(fields=['final_product', '-created_at'], name='final_price_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='finalpricehistory',
+            index=models.Index(condition=models.Q(('sell_price__gt', 0)), fields=['final_product', '-created_at'], name='final_price_positive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['ingredient', '-created_at'], name='price_history_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['-created_at', '-id'], name='price_history_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sellpricehistory',
+            index=models.Index(fields=['final_product', '-created_at'], name='sell_price_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sellpricehistory',
+            index=models.Index(fields=['-created_at', '-id'], name='sell_price_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sellpricehistory',
+            index=models.Index(condition=models.Q(('sell_price__gt', 0)), fields=['final_product', '-created_at'], name='sell_price_positive_idx'),
+        ),
+    ]
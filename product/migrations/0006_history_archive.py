@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-18 10:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0005_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistoryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit_price', models.PositiveBigIntegerField(verbose_name='قیمت واحد')),
+                ('created_at', models.DateTimeField(verbose_name='زمان ایجاد')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان بایگانی')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_prices', to='product.primaryingredient', verbose_name='ماده اولیه')),
+            ],
+            options={
+                'verbose_name': 'تاریخچه قیمت بایگانی شده',
+                'verbose_name_plural': 'تاریخچه قیمت های بایگانی شده',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['ingredient', '-created_at'], name='price_archive_latest_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SellPriceHistoryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sell_price', models.PositiveIntegerField(verbose_name='قیمت نهایی')),
+                ('created_at', models.DateTimeField(verbose_name='زمان ایجاد')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان بایگانی')),
+                ('final_product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_sell_prices', to='product.finalproduct', verbose_name='محصول نهایی')),
+            ],
+            options={
+                'verbose_name': 'تاریخچه قیمت نهایی بایگانی شده',
+                'verbose_name_plural': 'تاریخچه قیمت های نهایی بایگانی شده',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['final_product', '-created_at'], name='sell_price_archive_latest_idx')],
+            },
+        ),
+    ]
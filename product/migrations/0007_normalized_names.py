@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:04
+
+import re
+
+from django.db import migrations, models
+
+# a copy of utils.text.normalize_name as it was when this migration was written
+NAME_FOLDING = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', 'ـ': None,
+    '\u200c': ' ', '\u200f': None, '\u200e': None,
+    **{persian: str(digit) for digit, persian in enumerate('۰۱۲۳۴۵۶۷۸۹')},
+    **{arabic: str(digit) for digit, arabic in enumerate('٠١٢٣٤٥٦٧٨٩')},
+})
+
+
+def normalize_name(text):
+    return re.sub(r'\s+', ' ', (text or '').translate(NAME_FOLDING)).strip().lower()
+
+
+def fill_normalized_names(apps, schema_editor):
+    for model_name in ('PrimaryIngredient', 'FinalProduct'):
+        model = apps.get_model('product', model_name)
+        objects = list(model.objects.only('id', 'name'))
+        for obj in objects:
+            obj.normalized_name = normalize_name(obj.name)
+        model.objects.bulk_update(objects, ['normalized_name'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0006_history_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finalproduct',
+            name='normalized_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='primaryingredient',
+            name='normalized_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=250),
+        ),
+        migrations.RunPython(fill_normalized_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0007_normalized_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuSheet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='اثر انگشت محتوا')),
+                ('part', models.CharField(max_length=100, verbose_name='مسیر برگه در فایل خروجی')),
+                ('final_product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='menu_sheets', to='product.finalproduct', verbose_name='محصول نهایی')),
+                ('menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sheets', to='product.menu', verbose_name='ورودی و خروجی')),
+            ],
+            options={
+                'verbose_name': 'برگه خروجی',
+                'verbose_name_plural': 'برگه های خروجی',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0008_menu_sheets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menu',
+            name='export_format',
+            field=models.CharField(choices=[('xlsx', 'اکسل'), ('csv_zip', 'فایل فشرده CSV برای هر محصول'), ('csv', 'جدول CSV'), ('parquet', 'جدول Parquet')], default='xlsx', max_length=10, verbose_name='فرمت خروجی'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0009_menu_export_format'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=250, verbose_name='نام')),
+                ('unit', models.CharField(max_length=20, verbose_name='واحد')),
+                ('unit_price', models.PositiveBigIntegerField(verbose_name='قیمت واحد')),
+                ('menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_prices', to='product.menu', verbose_name='ورودی و خروجی')),
+            ],
+            options={
+                'verbose_name': 'قیمت در انتظار ورود',
+                'verbose_name_plural': 'قیمت های در انتظار ورود',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:45
+
+import time
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0010_staged_prices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finalproduct',
+            name='breakdown_version',
+            field=models.PositiveBigIntegerField(default=time.time_ns, editable=False, verbose_name='نسخه ریز قیمت'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0011_breakdown_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='نام')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='نسخه')),
+            ],
+            options={
+                'verbose_name': 'نسخه کش',
+                'verbose_name_plural': 'نسخه های کش',
+            },
+        ),
+    ]
@@ -1,8 +1,11 @@
-from django.core.exceptions import ValidationError
+import time
+
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.utils import timezone
 
 from utils.base_models import BaseModel
+from utils.text import normalize_name
 from jalali_date import date2jalali
 
 
@@ -24,10 +27,18 @@ class PrimaryIngredient(BaseModel):
                              verbose_name='واحد')
     related_ingredient = models.ManyToManyField('MiddleIngredient', verbose_name='ماده اولیه مرتبط', null=True,
                                                 blank=True, related_name='related_ingredient')
+    current_price = models.PositiveBigIntegerField(null=True, blank=True, editable=False, verbose_name='قیمت فعلی')
+    normalized_name = models.CharField(max_length=250, blank=True, editable=False, db_index=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        if kwargs.get('update_fields') is not None and 'name' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'normalized_name'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'ماده اولیه'
         verbose_name_plural = 'مواد اولیه'
@@ -35,19 +46,39 @@ class PrimaryIngredient(BaseModel):
 
 
 class PriceHistory(BaseModel):
-    unit_price = models.CharField(max_length=200, verbose_name='قیمت واحد')
+    unit_price = models.PositiveBigIntegerField(verbose_name='قیمت واحد')
     ingredient = models.ForeignKey(PrimaryIngredient, related_name='price_history', verbose_name='ماده اولیه',
                                    on_delete=models.CASCADE)
     signal_involved = models.BooleanField(default=True)
 
     def __str__(self):
         return str(
-            date2jalali(self.created_at.date())) + ' : ' + self.ingredient.name + ' -> ' + self.unit_price + ' تومان'
+            date2jalali(self.created_at.date())) + ' : ' + self.ingredient.name + ' -> ' + str(self.unit_price) + ' تومان'
 
     class Meta:
         verbose_name = 'تاریخچه قیمت'
         verbose_name_plural = 'تاریخچه قیمت ها'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['ingredient', '-created_at'], name='price_history_latest_idx'),
+            models.Index(fields=['-created_at', '-id'], name='price_history_created_idx'),
+        ]
+
+
+class PriceHistoryArchive(models.Model):
+    unit_price = models.PositiveBigIntegerField(verbose_name='قیمت واحد')
+    ingredient = models.ForeignKey(PrimaryIngredient, related_name='archived_prices', verbose_name='ماده اولیه',
+                                   on_delete=models.CASCADE)
+    created_at = models.DateTimeField(verbose_name='زمان ایجاد')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='زمان بایگانی')
+
+    class Meta:
+        verbose_name = 'تاریخچه قیمت بایگانی شده'
+        verbose_name_plural = 'تاریخچه قیمت های بایگانی شده'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['ingredient', '-created_at'], name='price_archive_latest_idx'),
+        ]
 
 
 class MiddleIngredient(BaseModel):
@@ -66,11 +97,6 @@ class MiddleIngredient(BaseModel):
     def __str__(self):
         return self.base_ingredient.name + ' : ' + ' ' + str(self.unit_amount) + ' ' + self.base_ingredient.unit.title
 
-    def clean(self):
-        print(self.__dict__)
-        if self.base_ingredient.related_ingredient.exists() and self.type == self.TypeChoices.PRIMARY:
-            raise ValidationError('در حال حاضر نمیتوانید محصول میانی که دارای محصول میانی است اضافه کنید')
-
     class Meta:
         verbose_name = 'محصول میانی'
         verbose_name_plural = 'محصولات میانی'
@@ -81,10 +107,26 @@ class FinalProduct(BaseModel):
     name = models.CharField(max_length=200, verbose_name='نام')
     ingredients = models.ManyToManyField(MiddleIngredient, related_name='final_products',
                                          verbose_name='مواد اولیه مورد نیاز')
+    current_cost = models.PositiveIntegerField(null=True, blank=True, editable=False,
+                                               verbose_name='قیمت محاسبه شده')
+    current_menu_price = models.PositiveIntegerField(null=True, blank=True, editable=False,
+                                                     verbose_name='قیمت ثبت شده در منو')
+    current_profit = models.IntegerField(null=True, blank=True, editable=False, verbose_name='سود محاسبه شده')
+    normalized_name = models.CharField(max_length=200, blank=True, editable=False, db_index=True)
+    # a fresh token whenever the cost breakdown changes, so cached breakdowns are keyed on it in every process;
+    # a new product gets a new one even when SQLite reuses the id of a deleted product
+    breakdown_version = models.PositiveBigIntegerField(default=time.time_ns, editable=False,
+                                                       verbose_name='نسخه ریز قیمت')
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        if kwargs.get('update_fields') is not None and 'name' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'normalized_name'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'محصول نهایی'
         verbose_name_plural = 'محصولات نهایی'
@@ -103,6 +145,11 @@ class FinalPriceHistory(BaseModel):
         verbose_name = 'تاریخچه قیمت داخل منو'
         verbose_name_plural = 'تاریخچه قیمت های داخل منو'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['final_product', '-created_at'], name='final_price_latest_idx'),
+            models.Index(fields=['final_product', '-created_at'], condition=models.Q(sell_price__gt=0),
+                         name='final_price_positive_idx'),
+        ]
 
 
 class SellPriceHistory(BaseModel):
@@ -117,11 +164,41 @@ class SellPriceHistory(BaseModel):
         verbose_name = 'تاریخچه قیمت نهایی'
         verbose_name_plural = 'تاریخجه قیمت های نهایی'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['final_product', '-created_at'], name='sell_price_latest_idx'),
+            models.Index(fields=['-created_at', '-id'], name='sell_price_created_idx'),
+            models.Index(fields=['final_product', '-created_at'], condition=models.Q(sell_price__gt=0),
+                         name='sell_price_positive_idx'),
+        ]
+
+
+class SellPriceHistoryArchive(models.Model):
+    sell_price = models.PositiveIntegerField(verbose_name='قیمت نهایی')
+    final_product = models.ForeignKey(FinalProduct, related_name='archived_sell_prices', on_delete=models.CASCADE,
+                                      verbose_name='محصول نهایی')
+    created_at = models.DateTimeField(verbose_name='زمان ایجاد')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='زمان بایگانی')
+
+    class Meta:
+        verbose_name = 'تاریخچه قیمت نهایی بایگانی شده'
+        verbose_name_plural = 'تاریخچه قیمت های نهایی بایگانی شده'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['final_product', '-created_at'], name='sell_price_archive_latest_idx'),
+        ]
 
 
 class Menu(BaseModel):
+    class ExportFormatChoices(models.TextChoices):
+        XLSX = 'xlsx', 'اکسل'
+        CSV_ZIP = 'csv_zip', 'فایل فشرده CSV برای هر محصول'
+        CSV = 'csv', 'جدول CSV'
+        PARQUET = 'parquet', 'جدول Parquet'
+
     file = models.FileField(verbose_name='فایل خروجی گرفته شده', null=True, blank=True, editable=False)
     imported_file = models.FileField(verbose_name='فایل ورودی قیمت ها', null=True, blank=True)
+    export_format = models.CharField(max_length=10, choices=ExportFormatChoices.choices,
+                                     default=ExportFormatChoices.XLSX, verbose_name='فرمت خروجی')
 
     def __str__(self):
         return str(date2jalali(self.created_at.date()))
@@ -130,3 +207,68 @@ class Menu(BaseModel):
         verbose_name = 'ورودی و خروجی'
         verbose_name_plural = 'ورودی و خروجی ها'
         ordering = ['-created_at']
+
+
+class MenuSheet(models.Model):
+    menu = models.ForeignKey(Menu, related_name='sheets', on_delete=models.CASCADE, verbose_name='ورودی و خروجی')
+    final_product = models.ForeignKey(FinalProduct, related_name='menu_sheets', on_delete=models.CASCADE,
+                                      verbose_name='محصول نهایی')
+    fingerprint = models.CharField(max_length=64, verbose_name='اثر انگشت محتوا')
+    part = models.CharField(max_length=100, verbose_name='مسیر برگه در فایل خروجی')
+
+    class Meta:
+        verbose_name = 'برگه خروجی'
+        verbose_name_plural = 'برگه های خروجی'
+
+
+class StagedPrice(models.Model):
+    menu = models.ForeignKey(Menu, related_name='staged_prices', on_delete=models.CASCADE,
+                             verbose_name='ورودی و خروجی')
+    name = models.CharField(max_length=250, verbose_name='نام')
+    unit = models.CharField(max_length=20, verbose_name='واحد')
+    unit_price = models.PositiveBigIntegerField(verbose_name='قیمت واحد')
+
+    class Meta:
+        verbose_name = 'قیمت در انتظار ورود'
+        verbose_name_plural = 'قیمت های در انتظار ورود'
+        ordering = ['id']
+
+
+class Job(BaseModel):
+    class StatusChoices(models.TextChoices):
+        QUEUED = 'q', 'در صف'
+        RUNNING = 'r', 'در حال اجرا'
+        DONE = 'd', 'انجام شده'
+        FAILED = 'f', 'ناموفق'
+
+    menu = models.ForeignKey(Menu, related_name='jobs', on_delete=models.CASCADE, verbose_name='ورودی و خروجی')
+    status = models.CharField(max_length=1, choices=StatusChoices.choices, default=StatusChoices.QUEUED,
+                              verbose_name='وضعیت')
+    progress = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(100)],
+                                                verbose_name='درصد پیشرفت')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='زمان شروع')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='زمان پایان')
+    error = models.TextField(blank=True, verbose_name='خطا')
+
+    def __str__(self):
+        return f'{self.menu} ({self.get_status_display()})'
+
+    @property
+    def duration(self):
+        if self.started_at:
+            return (self.finished_at or timezone.now()) - self.started_at
+
+    class Meta:
+        verbose_name = 'کار پس زمینه'
+        verbose_name_plural = 'کار های پس زمینه'
+        ordering = ['-created_at']
+
+
+class CacheVersion(models.Model):
+    """A counter bumped on changes no timestamp reflects, kept in the database so every process sees it."""
+    name = models.CharField(max_length=50, primary_key=True, verbose_name='نام')
+    version = models.PositiveBigIntegerField(default=0, verbose_name='نسخه')
+
+    class Meta:
+        verbose_name = 'نسخه کش'
+        verbose_name_plural = 'نسخه های کش'
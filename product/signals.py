@@ -1,79 +1,100 @@
-import os
-
-import pandas as pd
-from django.db.models.signals import post_save, m2m_changed
+from django.db import transaction
+from django.db.models.signals import post_save, m2m_changed, post_delete
 from django.dispatch import receiver
-from jalali_date import date2jalali
 
-from RestaurantAccountancy import settings
-from product.models import PriceHistory, FinalProduct, SellPriceHistory, Menu, MiddleIngredient
-from utils.utils import create_data, import_from_excel
+from product.models import PriceHistory, FinalProduct, SellPriceHistory, Menu, MiddleIngredient, PrimaryIngredient, \
+    FinalPriceHistory
+from utils.api_cache import invalidate_api_cache
+from utils.cost_graph import get_cost_graph, invalidate_cost_graph, queue_price_changes
+from utils.current_prices import sync_ingredient_prices, sync_product_prices
+from utils.instrumentation import instrumented_receiver
+from utils.jobs import enqueue_menu_job
 
 
 @receiver(post_save, sender=PriceHistory)
-def update_middle_ingredient_prices(sender, instance, created, **kwargs):
-    from product.models import PrimaryIngredient
-    if instance.signal_involved:
-        ingredient: PrimaryIngredient = instance.ingredient
-        if ingredient.middle_ingredients.exists():
-            for i in ingredient.middle_ingredients.all():
-                if i.related_ingredient.exists():
-                    for r in i.related_ingredient.all():
-                        PriceHistory.objects.create(ingredient=r, signal_involved=False,
-                                                    unit_price=int(float(instance.unit_price) * i.unit_amount))
+@receiver(post_delete, sender=PriceHistory)
+@instrumented_receiver
+def update_current_price(sender, instance, **kwargs):
+    sync_ingredient_prices([instance.ingredient_id])
+
+
+@receiver(post_save, sender=SellPriceHistory)
+@receiver(post_delete, sender=SellPriceHistory)
+@receiver(post_save, sender=FinalPriceHistory)
+@receiver(post_delete, sender=FinalPriceHistory)
+@instrumented_receiver
+def update_current_product_prices(sender, instance, **kwargs):
+    sync_product_prices([instance.final_product_id])
 
 
 @receiver(post_save, sender=PriceHistory)
+@instrumented_receiver
 def update_final_product(sender, instance: PriceHistory, created, **kwargs):
-    finals = FinalProduct.objects.filter(ingredients__base_ingredient=instance.ingredient)
-    if finals.exists():
-        for final in finals:
-            price = 0
-            for i in final.ingredients.all():
-                price += int(
-                    float(PriceHistory.objects.filter(ingredient=i.base_ingredient).order_by(
-                        '-created_at').first().unit_price) * i.unit_amount)
-            if price > 0:
-                SellPriceHistory.objects.create(sell_price=price, final_product=final)
+    queue_price_changes(ingredient_ids=[instance.ingredient_id])
+
+
+@receiver(m2m_changed, sender=FinalProduct.ingredients.through)
+@instrumented_receiver
+def update_prices(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        invalidate_cost_graph()
+        queue_price_changes(product_ids=(pk_set or ()) if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=MiddleIngredient)
+@receiver(post_save, sender=PrimaryIngredient)
+@instrumented_receiver
+def update_recipe_costs(sender, instance, **kwargs):
+    # unit amounts, names and units show up in the cost breakdown of every product using the ingredient
+    ingredient_id = instance.base_ingredient_id if sender is MiddleIngredient else instance.pk
+    if sender is MiddleIngredient:
+        # the unit amount may have changed; outside a transaction the changes are propagated right away
+        invalidate_cost_graph()
+    queue_price_changes(ingredient_ids=[ingredient_id])
+
+
+@receiver(m2m_changed, sender=PrimaryIngredient.related_ingredient.through)
+@instrumented_receiver
+def prevent_recipe_cycles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_add':
+        graph = get_cost_graph()
+        links = [(composite_id, [instance.pk]) for composite_id in pk_set] if reverse else [(instance.pk, pk_set)]
+        # a last guard for edits outside the admin form, which reports cycles as form errors; raises RecipeCycleError
+        for composite_id, middle_ids in links:
+            graph.check_recipe(composite_id, middle_ids)
+
+
+@receiver(m2m_changed, sender=PrimaryIngredient.related_ingredient.through)
+@receiver(post_save, sender=MiddleIngredient)
+@receiver(post_delete, sender=MiddleIngredient)
+@receiver(post_delete, sender=PrimaryIngredient)
+@receiver(post_delete, sender=FinalProduct)
+# the graph only applies price rows added since it was loaded, so a deleted one needs a reload
+@receiver(post_delete, sender=PriceHistory)
+@instrumented_receiver
+def reset_cost_graph(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        invalidate_cost_graph()
 
 
 @receiver(m2m_changed, sender=FinalProduct.ingredients.through)
-def update_prices(sender, instance, action, **kwargs):
-    if action in ['post_add']:
-        price = 0
-        for i in instance.ingredients.all():
-            price += int(
-                float(PriceHistory.objects.filter(ingredient=i.base_ingredient).first().unit_price) * i.unit_amount)
-        SellPriceHistory.objects.create(sell_price=price, final_product=instance)
+@receiver(post_save, sender=MiddleIngredient)
+@receiver(post_delete, sender=MiddleIngredient)
+@receiver(post_save, sender=PrimaryIngredient)
+@receiver(post_delete, sender=PrimaryIngredient)
+@receiver(post_save, sender=FinalProduct)
+@receiver(post_delete, sender=FinalProduct)
+@receiver(post_delete, sender=PriceHistory)
+@receiver(post_delete, sender=SellPriceHistory)
+@receiver(post_delete, sender=FinalPriceHistory)
+@instrumented_receiver
+def reset_api_cache(sender, **kwargs):
+    # new prices are picked up from the history timestamps; recipe and name edits and deleted prices are not
+    if kwargs.get('action', 'post_').startswith('post_'):
+        transaction.on_commit(invalidate_api_cache)
 
 
 @receiver(post_save, sender=Menu)
+@instrumented_receiver
 def export_data(sender, instance, created, **kwargs):
-    if instance.imported_file:
-        import_from_excel(instance.imported_file)
-
-    path = os.path.join(settings.MEDIA_ROOT, f'menu_{str(date2jalali(instance.created_at.date()))}.xlsx')
-
-    with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
-        cell_format = writer.book.add_format(
-            {
-                'border': 1,
-                'align': 'center',
-                'valign': 'vcenter',
-                'text_wrap': True,
-                'font_size': 12,
-                'font_name': 'B Nazanin',
-                'num_format': '#,##0'
-            })
-
-        # Write data for each FinalProduct starting from the first sheet
-        for i, product in enumerate(FinalProduct.objects.all()):
-            data = create_data(product)
-            sheet_name = f'{product.name}' if i == 0 else f'{product.name}_{i}'
-            data.to_excel(writer, index=False, sheet_name=sheet_name)
-            worksheet = writer.sheets[sheet_name]
-            for idx, col in enumerate(data.columns):
-                max_len = max(data[col].astype(str).apply(len).max(), len(col))
-                worksheet.set_column(idx, idx, max_len + 2, cell_format)
-
-    Menu.objects.filter(id=instance.id).update(file=path.split(settings.MEDIA_ROOT)[1])
+    enqueue_menu_job(instance)
@@ -1,3 +1,1025 @@
-from django.test import TestCase
+import csv
+import datetime
+import importlib.util
+import json
+import os
+import re
+import subprocess
+import sys
+import unittest
+import shutil
+import tempfile
+import zipfile
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+
+from product.models import Unit, PrimaryIngredient, PriceHistory, MiddleIngredient, FinalProduct, SellPriceHistory, \
+    FinalPriceHistory, Menu, Job, PriceHistoryArchive, SellPriceHistoryArchive, CacheVersion
+from product.admin import MenuForm, PrimaryIngredientAdminForm
+from utils.api_cache import api_version
+from utils.cost_cache import get_breakdowns, get_breakdown, cost_cache_stats, reset_cost_cache_stats, \
+    breakdown_key
+from utils.cost_graph import invalidate_cost_graph, get_cost_graph, RecipeCycleError
+from utils.current_prices import last_price_subquery, last_product_price_subquery, annotate_product_prices, \
+    annotate_sell_price_history, sync_ingredient_prices
+from utils.benchmark import run_benchmarks, compare
+from utils.compaction import period_start
+from utils.costing import menu_cost_as_of, menu_cost_between
+from utils.export import export_menu, build_rows, load_products
+from utils.export_formats import export_csv, export_csv_bundle, export_parquet
+from utils.formats import get_importer, get_exporter, export_extension
+from utils.jobs import run_pending_jobs
+from utils.long_format import LONG_COLUMNS
+from utils.instrumentation import get_records, clear_records, measure, normalize_sql
+from utils.simulation import simulate
+from utils.text import normalize_name, PREFIX_END
+from utils.importers import import_from_excel, stage_excel, stage_csv, csv_rows, diff_report, \
+    bulk_import_prices
+
+
+class RecipeTestCase(TestCase):
+    def setUp(self):
+        invalidate_cost_graph()
+        cache.clear()
+        unit = Unit.objects.create(title='کیلوگرم')
+        self.meat = PrimaryIngredient.objects.create(name='گوشت', unit=unit)
+        self.rice = PrimaryIngredient.objects.create(name='برنج', unit=unit)
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.meat, unit_price=1000)
+            PriceHistory.objects.create(ingredient=self.rice, unit_price=300)
+            self.meat_half = MiddleIngredient.objects.create(base_ingredient=self.meat, unit_amount=0.5)
+            self.rice_double = MiddleIngredient.objects.create(base_ingredient=self.rice, unit_amount=2)
+            self.kebab = FinalProduct.objects.create(name='چلوکباب')
+            self.kebab.ingredients.add(self.meat_half, self.rice_double)
+
+    def commit(self):
+        # costs are propagated on commit, which never happens inside a TestCase
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def last_cost(self, product):
+        return SellPriceHistory.objects.filter(final_product=product).first().sell_price
+
+
+class CostGraphTest(RecipeTestCase):
+    def test_recipe_cost_on_ingredient_add(self):
+        self.assertEqual(self.last_cost(self.kebab), 1100)
+
+    def test_price_change_pushes_delta_to_products(self):
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.meat, unit_price=1500)
+        self.assertEqual(self.last_cost(self.kebab), 1350)
+        self.assertEqual(get_cost_graph().product_cost(self.kebab.pk), 1350)
+
+    def test_price_change_updates_composite_ingredients(self):
+        unit = Unit.objects.create(title='لیتر')
+        sauce = PrimaryIngredient.objects.create(name='سس', unit=unit)
+        sauce.related_ingredient.add(self.meat_half, self.rice_double)
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.rice, unit_price=400)
+        self.assertEqual(PriceHistory.objects.filter(ingredient=sauce).first().unit_price, 1300)
+
+    def test_changes_are_propagated_once_per_transaction(self):
+        before = SellPriceHistory.objects.filter(final_product=self.kebab).count()
+        with self.commit():
+            for price in (1100, 1200, 1300):
+                PriceHistory.objects.create(ingredient=self.meat, unit_price=price)
+            PriceHistory.objects.create(ingredient=self.rice, unit_price=350)
+            self.assertEqual(SellPriceHistory.objects.filter(final_product=self.kebab).count(), before)
+        self.assertEqual(SellPriceHistory.objects.filter(final_product=self.kebab).count(), before + 1)
+        self.assertEqual(self.last_cost(self.kebab), 1350)
+
+    def test_unchanged_cost_writes_no_history(self):
+        before = SellPriceHistory.objects.filter(final_product=self.kebab).count()
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.meat, unit_price=1000)
+        self.assertEqual(SellPriceHistory.objects.filter(final_product=self.kebab).count(), before)
+
+    def test_rebuilt_graph_matches_incremental_state(self):
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.rice, unit_price=250)
+        incremental = get_cost_graph().product_cost(self.kebab.pk)
+        invalidate_cost_graph()
+        self.assertEqual(get_cost_graph().product_cost(self.kebab.pk), incremental)
+
+    def test_deleted_price_is_not_kept_by_the_graph(self):
+        with self.commit():
+            expensive = PriceHistory.objects.create(ingredient=self.meat, unit_price=5000)
+        expensive.delete()
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.rice, unit_price=310)
+        self.assertEqual(self.last_cost(self.kebab), 1120)
+
+    def test_price_deleted_by_another_process_is_not_kept_by_the_graph(self):
+        with self.commit():
+            mistake = PriceHistory.objects.create(ingredient=self.meat, unit_price=10000)
+        get_cost_graph()
+        # another process deletes the row, without signals in this one, and fixes the current price
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {PriceHistory._meta.db_table} WHERE id = %s', [mistake.pk])
+        sync_ingredient_prices([self.meat.pk])
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.rice, unit_price=310)
+        self.assertEqual(self.last_cost(self.kebab), 1120)
+
+    def test_recipe_change_from_another_process_reloads_graph(self):
+        meat = MiddleIngredient.objects.create(base_ingredient=self.meat, unit_amount=1)
+        get_cost_graph()
+        # written without signals, as another process would look to this one
+        FinalProduct.ingredients.through.objects.create(finalproduct=self.kebab, middleingredient=meat)
+        self.assertEqual(get_cost_graph().product_cost(self.kebab.pk), 2100)
+
+
+def make_price_list(rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Page 1'
+    ws.append(['لیست قیمت'])
+    ws.append(['ردیف', 'نام کالا', 'واحد', 'قیمت'])
+    for i, row in enumerate(rows, start=1):
+        ws.append([i, *row])
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    wb.save(path)
+    return path
+
+
+class MultiLevelRecipeTestCase(RecipeTestCase):
+    def composite(self, name, *middles):
+        ingredient = PrimaryIngredient.objects.create(name=name, unit=self.meat.unit)
+        ingredient.related_ingredient.add(*middles)
+        return ingredient
+
+    def middle(self, ingredient, unit_amount):
+        return MiddleIngredient.objects.create(base_ingredient=ingredient, unit_amount=unit_amount)
+
+    def setUp(self):
+        super().setUp()
+        self.stock = self.composite('آب گوشت', self.meat_half)
+        self.base = self.composite('پایه سس', self.middle(self.stock, 2), self.rice_double)
+        self.sauce = self.composite('سس', self.middle(self.base, 1), self.middle(self.stock, 1))
+        with self.commit():
+            self.stew = FinalProduct.objects.create(name='خورش')
+            self.stew.ingredients.add(self.middle(self.sauce, 0.5))
+            PriceHistory.objects.create(ingredient=self.meat, unit_price=1000)
+
+
+class MultiLevelRecipeTest(MultiLevelRecipeTestCase):
+    def test_costs_resolve_through_every_level(self):
+        # stock 500, base 2 * 500 + 600 = 1600, sauce 1600 + 500 = 2100
+        for ingredient, price in ((self.stock, 500), (self.base, 1600), (self.sauce, 2100)):
+            ingredient.refresh_from_db()
+            self.assertEqual(ingredient.current_price, price)
+        self.assertEqual(self.last_cost(self.stew), 1050)
+
+    def test_shared_sub_recipes_are_evaluated_once_in_order(self):
+        order = get_cost_graph().composites_downstream([self.meat.pk])
+        self.assertEqual(order, [self.stock.pk, self.base.pk, self.sauce.pk])
+
+    def test_cycles_are_rejected(self):
+        sauce = self.middle(self.sauce, 1)
+        with self.assertRaises(RecipeCycleError), transaction.atomic():
+            self.stock.related_ingredient.add(sauce)
+        form = PrimaryIngredientAdminForm(instance=self.stock)
+        form.cleaned_data = {'related_ingredient': [sauce]}
+        with self.assertRaises(ValidationError):
+            form.clean_related_ingredient()
+
+
+class CostAsOfTest(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.now().date()
+        PriceHistory.objects.filter(ingredient=self.meat).update(created_at=timezone.now() - datetime.timedelta(days=5))
+        PriceHistory.objects.create(ingredient=self.meat, unit_price=1500)
+        PriceHistory.objects.filter(ingredient=self.rice).update(created_at=timezone.now() - datetime.timedelta(days=2))
+        self.rice_only = FinalProduct.objects.create(name='پلو')
+        self.rice_only.ingredients.add(self.rice_double)
+
+    def test_costs_whole_menu_for_each_date(self):
+        days_ago = [self.today - datetime.timedelta(days=days) for days in (0, 3, 10)]
+        costs = menu_cost_as_of(days_ago)
+        self.assertEqual(costs.loc[:, self.kebab.pk].fillna(-1).tolist(), [-1, -1, 1350])
+        self.assertEqual(costs.loc[:, self.rice_only.pk].fillna(-1).tolist(), [-1, -1, 600])
+        self.assertEqual(menu_cost_between(self.today - datetime.timedelta(days=1), self.today).shape, (2, 2))
+
+    def test_admin_report(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        response = self.client.get(reverse('admin:product_finalproduct_cost_as_of'), {
+            'start': self.today - datetime.timedelta(days=3), 'end': self.today, 'frequency': 'D'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['dates']), 4)
+        self.assertIn(('پلو', [None, '600 ریال ', '600 ریال ', '600 ریال ']), response.context['rows'])
+
+
+class SimulationTest(MultiLevelRecipeTestCase):
+    def test_scenarios_do_not_touch_history(self):
+        FinalPriceHistory.objects.create(final_product=self.kebab, sell_price=1400)
+        history = PriceHistory.objects.count(), SellPriceHistory.objects.count()
+        result = simulate([
+            {'name': 'now'},
+            {'name': 'meat', 'factors': {self.meat.pk: 1.5}},
+            {'name': 'rice', 'prices': {self.rice.pk: 400}},
+        ])
+        self.assertEqual((PriceHistory.objects.count(), SellPriceHistory.objects.count()), history)
+        self.assertEqual([result.cost(name, self.kebab.pk) for name in ('now', 'meat', 'rice')], [1100, 1350, 1300])
+        self.assertEqual(result.profit('meat', self.kebab.pk), 50)
+        self.assertEqual(result.summary()[1]['loss_making'], 0)
+
+    def test_composites_are_repriced_per_scenario(self):
+        # stock 750, base 2 * 750 + 600 = 2100, sauce 2100 + 750 = 2850, stew half of the sauce
+        result = simulate([{'name': 'meat', 'factors': {self.meat.pk: 1.5}}])
+        self.assertEqual(result.cost('meat', self.stew.pk), 1425)
+
+
+class CostCacheTest(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pilaf = FinalProduct.objects.create(name='پلو')
+        with self.commit():
+            self.pilaf.ingredients.add(self.rice_double)
+        reset_cost_cache_stats()
+
+    def test_breakdowns_are_cached_until_their_version_changes(self):
+        get_breakdowns([self.kebab.pk, self.pilaf.pk])
+        with self.assertNumQueries(1):
+            self.assertEqual(get_breakdown(self.kebab.pk)['cost'], 1100)
+        self.assertEqual(cost_cache_stats(), {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3})
+
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.meat, unit_price=1500)
+        with self.assertNumQueries(2):
+            breakdowns = get_breakdowns([self.kebab.pk, self.pilaf.pk])
+        self.assertEqual((breakdowns[self.kebab.pk]['cost'], breakdowns[self.pilaf.pk]['cost']), (1350, 600))
+        self.assertEqual(cost_cache_stats()['misses'], 3)
+
+    def test_versions_are_read_from_the_database(self):
+        get_breakdowns([self.kebab.pk])
+        # another process bumped the version; this process' cache still holds the old breakdown
+        FinalProduct.objects.filter(pk=self.kebab.pk).update(breakdown_version=F('breakdown_version') + 1)
+        MiddleIngredient.objects.filter(pk=self.meat_half.pk).update(unit_amount=1)
+        self.assertEqual(get_breakdown(self.kebab.pk)['cost'], 1600)
+
+    def test_exports_do_not_read_the_cache(self):
+        get_breakdowns([self.kebab.pk])
+        cache.set(breakdown_key(self.kebab.pk, FinalProduct.objects.get(pk=self.kebab.pk).breakdown_version),
+                  {'cost': 0, 'ingredients': []})
+        self.assertEqual([breakdown['cost'] for _, breakdown in load_products()], [600, 1100])
+
+    def test_recipe_edits_bump_versions(self):
+        get_breakdowns([self.kebab.pk, self.pilaf.pk])
+        with self.commit():
+            self.kebab.ingredients.remove(self.meat_half)
+        self.assertEqual(get_breakdown(self.kebab.pk)['cost'], 600)
+        with self.commit():
+            self.rice_double.unit_amount = 3
+            self.rice_double.save()
+        self.assertEqual(get_breakdown(self.pilaf.pk)['cost'], 900)
+        self.assertEqual(self.last_cost(self.pilaf), 900)
+
+    def test_unit_amount_change_outside_transaction(self):
+        get_cost_graph()
+        # outside a transaction on_commit callbacks run as soon as they are registered
+        with mock.patch('utils.cost_graph.transaction.on_commit', lambda callback: callback()):
+            self.meat_half.unit_amount = 1
+            self.meat_half.save()
+        self.kebab.refresh_from_db()
+        self.assertEqual(self.kebab.current_cost, 1600)
+
+    @override_settings(COST_CACHE_TIMEOUT=60)
+    def test_entries_expire(self):
+        cache.clear()
+        with mock.patch('django.core.cache.cache.set_many') as set_many:
+            get_breakdowns([self.kebab.pk])
+        self.assertEqual([call.args[1] for call in set_many.call_args_list], [60])
+
+
+class CurrentPriceTest(RecipeTestCase):
+    def test_columns_follow_history_writes(self):
+        FinalPriceHistory.objects.create(final_product=self.kebab, sell_price=1500)
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.meat, unit_price=1200)
+        self.meat.refresh_from_db()
+        self.kebab.refresh_from_db()
+        self.assertEqual(self.meat.current_price, 1200)
+        self.assertEqual((self.kebab.current_cost, self.kebab.current_menu_price, self.kebab.current_profit),
+                         (1200, 1500, 300))
+
+    def test_deleting_history_restores_previous_price(self):
+        PriceHistory.objects.create(ingredient=self.meat, unit_price=1200).delete()
+        self.meat.refresh_from_db()
+        self.assertEqual(self.meat.current_price, 1000)
+
+    def test_admin_searches_numeric_prices(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        url = reverse('admin:product_pricehistory_changelist')
+        self.assertEqual([p.unit_price for p in self.client.get(url, {'q': '۳۰۰'}).context['cl'].queryset], [300])
+        self.assertEqual(self.client.get(url, {'q': 'برنج'}).status_code, 200)
+
+    def test_rebuild_command(self):
+        FinalProduct.objects.update(current_cost=None)
+        PrimaryIngredient.objects.update(current_price=None)
+        call_command('rebuild_current_prices', stdout=StringIO())
+        self.kebab.refresh_from_db()
+        self.assertEqual(self.kebab.current_cost, 1100)
+        self.assertEqual(PrimaryIngredient.objects.get(pk=self.rice.pk).current_price, 300)
+
+
+class BulkImportTest(RecipeTestCase):
+    job_inline = {'jobs-TOTAL_FORMS': 0, 'jobs-INITIAL_FORMS': 0}
+
+    def import_rows(self, rows):
+        path = make_price_list(rows)
+        self.addCleanup(os.remove, path)
+        import_from_excel(SimpleNamespace(path=path))
+
+    def test_import_creates_units_ingredients_and_prices(self):
+        self.import_rows([('پنیر', 'بسته', 250), ('گوشت', 'کیلوگرم', 1200)])
+        cheese = PrimaryIngredient.objects.get(name='پنیر')
+        self.assertEqual(cheese.unit.title, 'بسته')
+        self.assertEqual(cheese.price_history.first().unit_price, 250)
+        self.assertEqual(PrimaryIngredient.objects.filter(name='گوشت').count(), 1)
+
+    def test_import_recomputes_each_product_once(self):
+        before = SellPriceHistory.objects.filter(final_product=self.kebab).count()
+        self.import_rows([('گوشت', 'کیلوگرم', 2000), ('برنج', 'کیلوگرم', 100)])
+        self.assertEqual(SellPriceHistory.objects.filter(final_product=self.kebab).count(), before + 1)
+        self.assertEqual(self.last_cost(self.kebab), 1200)
+
+    def test_invalid_file_imports_nothing(self):
+        with self.assertRaises(Exception):
+            self.import_rows([('پنیر', 'بسته', 250), ('ماست', 'بسته', 'نامعتبر')])
+        self.assertFalse(PrimaryIngredient.objects.filter(name='پنیر').exists())
+
+    def test_reimport_writes_only_changed_prices(self):
+        before = PriceHistory.objects.count(), SellPriceHistory.objects.filter(final_product=self.kebab).count()
+        self.import_rows([('گوشت', 'کیلوگرم', 1000), ('برنج', 'کیلوگرم', 400), ('برنج', 'کیلوگرم', 300)])
+        self.assertEqual(PriceHistory.objects.count(), before[0])
+        self.import_rows([('گوشت', 'کیلوگرم', 1000), ('برنج', 'کیلوگرم', 400)])
+        self.assertEqual(PriceHistory.objects.count(), before[0] + 1)
+        self.assertEqual(SellPriceHistory.objects.filter(final_product=self.kebab).count(), before[1] + 1)
+        self.assertEqual(self.last_cost(self.kebab), 1300)
+
+    def test_dry_run_reports_diff_without_writing(self):
+        FinalPriceHistory.objects.create(final_product=self.kebab, sell_price=1500)
+        before = PriceHistory.objects.count()
+        report = diff_report([('گوشت', 'کیلوگرم', 1500), ('برنج', 'کیلوگرم', 300), ('پنیر', 'بسته', 250)])
+        self.assertEqual(report['new_ingredients'], [{'name': 'پنیر', 'unit': 'بسته', 'price': 250}])
+        self.assertEqual(report['changed_prices'], [{'name': 'گوشت', 'old_price': 1000, 'new_price': 1500,
+                                                     'percent': 50.0}])
+        self.assertEqual(report['unchanged'], 1)
+        self.assertEqual(report['products'], [{'name': 'چلوکباب', 'old_cost': 1100, 'new_cost': 1350,
+                                               'old_profit': 400, 'new_profit': 150}])
+        self.assertEqual(PriceHistory.objects.count(), before)
+        self.assertFalse(PrimaryIngredient.objects.filter(name='پنیر').exists())
+
+    def test_dry_run_rounds_like_the_import(self):
+        with self.commit():
+            platter = FinalProduct.objects.create(name='سینی گوشت')
+            platter.ingredients.add(*[MiddleIngredient.objects.create(base_ingredient=self.meat, unit_amount=0.5)
+                                      for _ in range(3)])
+        FinalPriceHistory.objects.create(final_product=platter, sell_price=3000)
+        rows = [('گوشت', 'کیلوگرم', 1003)]
+        predicted = {row['name']: row for row in diff_report(rows)['products']}['سینی گوشت']
+        with self.commit():
+            bulk_import_prices(rows)
+        platter.refresh_from_db()
+        self.assertEqual((predicted['new_cost'], predicted['new_profit']), (1503, 1497))
+        self.assertEqual((platter.current_cost, platter.current_profit), (1503, 1497))
+
+    def test_import_command_dry_run(self):
+        path = make_price_list([('گوشت', 'کیلوگرم', 900)])
+        self.addCleanup(os.remove, path)
+        out = StringIO()
+        call_command('import_prices', path, '--dry-run', stdout=out)
+        self.assertIn('گوشت: 1,000 -> 900 (-10.0%)', out.getvalue())
+        self.assertIn('چلوکباب: cost 1,100 -> 1,050', out.getvalue())
+        self.assertEqual(self.meat.price_history.count(), 1)
+
+    def test_staging_reports_every_bad_row(self):
+        path = make_price_list([('پنیر', 'بسته', 250), ('ماست', 'بسته', 'نامعتبر'), (None, 'بسته', -5)])
+        self.addCleanup(os.remove, path)
+        with self.assertRaises(ValidationError) as error:
+            stage_excel(SimpleNamespace(path=path))
+        self.assertEqual(error.exception.messages, [
+            'ردیف 4: قیمت «نامعتبر» عدد صحیح و مثبت نیست',
+            'ردیف 5: نام کالا وارد نشده است، قیمت «-5» عدد صحیح و مثبت نیست',
+        ])
+
+    def test_csv_upload_is_staged_once_and_committed_by_the_job(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        upload = SimpleUploadedFile('prices.csv', 'ردیف,نام کالا,واحد,قیمت\n1,پنیر,بسته,"۲۵۰"\n2,گوشت,کیلوگرم,"2,000"\n'
+                                    .encode('utf-8-sig'))
+        with override_settings(JOB_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp()), \
+                mock.patch('utils.importers.csv_rows', wraps=csv_rows) as parsed, self.commit():
+            response = self.client.post(reverse('admin:product_menu_add'), {
+                'imported_file': upload, 'export_format': Menu.ExportFormatChoices.CSV, **self.job_inline})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(parsed.call_count, 1)
+        menu = Menu.objects.get()
+        self.assertEqual(menu.jobs.get().status, Job.StatusChoices.DONE)
+        self.assertFalse(menu.staged_prices.exists())
+        self.assertEqual(PrimaryIngredient.objects.get(name='پنیر').current_price, 250)
+        self.assertEqual(self.last_cost(self.kebab), 1600)
+
+    def test_formats_without_their_libraries_are_not_offered(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        installed = {'pyarrow': None}
+        with mock.patch('utils.formats.find_spec', lambda module: installed[module]):
+            response = self.client.post(reverse('admin:product_menu_add'), {
+                'export_format': Menu.ExportFormatChoices.PARQUET, **self.job_inline})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(Menu.ExportFormatChoices.PARQUET, dict(MenuForm().fields['export_format'].choices))
+            installed['pyarrow'] = object()
+            self.assertIn(Menu.ExportFormatChoices.PARQUET, dict(MenuForm().fields['export_format'].choices))
+        self.assertFalse(Menu.objects.exists())
+
+    def test_admin_shows_row_errors(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        upload = SimpleUploadedFile('prices.csv', 'ردیف,نام کالا,واحد,قیمت\n1,پنیر,,250\n'.encode())
+        response = self.client.post(reverse('admin:product_menu_add'), {
+            'imported_file': upload, 'export_format': Menu.ExportFormatChoices.XLSX, **self.job_inline})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'ردیف 2: واحد وارد نشده است')
+        self.assertFalse(Menu.objects.exists())
+
+
+class ExportTest(RecipeTestCase):
+    def export(self):
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        export_menu(path)
+        return load_workbook(path)
+
+    def sheet_rows(self, workbook, name):
+        return [[cell.value for cell in row] for row in workbook[name].iter_rows()]
+
+    def test_incremental_export_renders_only_changed_sheets(self):
+        with self.commit():
+            pilaf = FinalProduct.objects.create(name='پلو')
+            pilaf.ingredients.add(self.rice_double)
+            stew = FinalProduct.objects.create(name='خورش')
+            stew.ingredients.add(self.meat_half)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'menu.xlsx')
+        sheets = export_menu(path)
+        before = load_workbook(path)
+
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.meat, unit_price=1500)
+        with mock.patch('utils.export.build_rows', wraps=build_rows) as rendered:
+            export_menu(path, previous=(path, sheets))
+        # the first sheet is always rendered, pilaf does not use meat
+        self.assertEqual([call.args[0] for call in rendered.call_args_list], [stew, self.kebab])
+
+        after = load_workbook(path)
+        self.assertEqual(after.sheetnames, before.sheetnames)
+        self.assertEqual(self.sheet_rows(after, 'پلو_1'), self.sheet_rows(before, 'پلو_1'))
+        self.assertEqual(self.sheet_rows(after, 'چلوکباب_2')[5], ['چلوکباب', '1,350', None, None])
+        self.assertEqual(os.listdir(directory), ['menu.xlsx'])
+
+    def test_export_keeps_sheet_layout(self):
+        FinalPriceHistory.objects.create(final_product=self.kebab, sell_price=1500)
+        ws = self.export()['چلوکباب']
+        rows = [[cell.value for cell in row] for row in ws.iter_rows()]
+        self.assertEqual(rows[0], ['نام محصول', 'واحد', 'نسبت مورد نیاز', 'قیمت نهایی'])
+        self.assertCountEqual(rows[1:3], [['گوشت', 'کیلوگرم', 0.5, '1,000'], ['برنج', 'کیلوگرم', 2, '300']])
+        self.assertEqual(rows[5], ['چلوکباب', '1,100', '1,500', '400'])
+
+    def test_export_query_count_does_not_grow_with_products(self):
+        for i in range(5):
+            product = FinalProduct.objects.create(name=f'غذا {i}')
+            product.ingredients.add(self.meat_half, self.rice_double)
+        # the products and their breakdowns, on every export
+        for _ in range(2):
+            with self.assertNumQueries(2):
+                self.export()
+
+
+class LongFormatExportTest(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        FinalPriceHistory.objects.create(final_product=self.kebab, sell_price=1500)
+        FinalProduct.objects.create(name='نوشابه')
+
+    def export(self, exporter, suffix):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        exporter(path)
+        return path
+
+    def read_csv(self, text):
+        return list(csv.reader(StringIO(text)))
+
+    def test_csv_table_has_a_row_per_product_ingredient(self):
+        with open(self.export(export_csv, '.csv'), encoding='utf-8-sig') as f:
+            rows = self.read_csv(f.read())
+        self.assertEqual(rows[0], ['product', 'ingredient', 'unit', 'amount', 'price', 'cost', 'menu_price', 'profit'])
+        self.assertCountEqual(rows[1:], [
+            ['چلوکباب', 'گوشت', 'کیلوگرم', '0.5', '1000', '500', '1500', '400'],
+            ['چلوکباب', 'برنج', 'کیلوگرم', '2.0', '300', '600', '1500', '400'],
+            ['نوشابه', '', '', '', '', '', '', ''],
+        ])
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_parquet_table_matches_the_csv_table(self):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(self.export(export_parquet, '.parquet'))
+        self.assertEqual(table.column_names, LONG_COLUMNS)
+        with open(self.export(export_csv, '.csv'), encoding='utf-8-sig') as f:
+            csv_rows = self.read_csv(f.read())[1:]
+        parquet_rows = [['' if value is None else str(value) for value in row.values()] for row in table.to_pylist()]
+        self.assertCountEqual(parquet_rows, csv_rows)
+
+    def test_csv_bundle_has_a_file_per_product(self):
+        with zipfile.ZipFile(self.export(export_csv_bundle, '.zip')) as archive:
+            # named like the xlsx sheets, newest product first
+            self.assertEqual(archive.namelist(), ['نوشابه.csv', 'چلوکباب_1.csv'])
+            rows = self.read_csv(archive.read('چلوکباب_1.csv').decode('utf-8-sig'))
+        self.assertEqual(len(rows), 3)
+
+
+@override_settings(JOB_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp())
+class MenuJobTest(RecipeTestCase):
+    def test_menu_save_queues_job_until_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            menu = Menu.objects.create()
+        self.assertEqual(menu.jobs.get().status, Job.StatusChoices.QUEUED)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_job_exports_file_and_reports_progress(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            menu = Menu.objects.create()
+        job = menu.jobs.get()
+        menu.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (Job.StatusChoices.DONE, 100))
+        self.assertTrue(os.path.exists(menu.file.path))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(list(menu.sheets.values_list('final_product', flat=True)), [self.kebab.pk])
+
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        self.assertEqual(self.client.get(reverse('admin:product_job_change', args=[job.pk])).status_code, 200)
+        response = self.client.get(reverse('admin:product_job_progress', args=[job.pk]))
+        self.assertEqual(response.json()['download_url'], reverse('admin:product_job_download', args=[job.pk]))
+        response = self.client.get(response.json()['download_url'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_jobs_of_dead_workers_are_run_again(self):
+        with self.captureOnCommitCallbacks():
+            stale, running = Menu.objects.create(), Menu.objects.create()
+        started_at = timezone.now() - datetime.timedelta(seconds=settings.JOB_TIMEOUT + 60)
+        stale.jobs.update(status=Job.StatusChoices.RUNNING, started_at=started_at)
+        running.jobs.update(status=Job.StatusChoices.RUNNING, started_at=timezone.now())
+        run_pending_jobs()
+        self.assertEqual(stale.jobs.get().status, Job.StatusChoices.DONE)
+        self.assertEqual(running.jobs.get().status, Job.StatusChoices.RUNNING)
+
+    def test_job_exports_selected_format(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            menu = Menu.objects.create(export_format=Menu.ExportFormatChoices.CSV_ZIP)
+        menu.refresh_from_db()
+        self.assertEqual(menu.jobs.get().status, Job.StatusChoices.DONE)
+        self.assertTrue(menu.file.name.endswith('.zip'))
+        self.assertTrue(zipfile.is_zipfile(menu.file.path))
+        self.assertFalse(menu.sheets.exists())
+
+    def test_same_day_menus_do_not_share_reused_sheets(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            older = Menu.objects.create()
+        with self.captureOnCommitCallbacks(execute=True):
+            newer = Menu.objects.create()
+        with self.commit():
+            pilaf = FinalProduct.objects.create(name='پلو')
+            pilaf.ingredients.add(self.rice_double)
+        with self.captureOnCommitCallbacks(execute=True):
+            older.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            latest = Menu.objects.create()
+        older.refresh_from_db()
+        newer.refresh_from_db()
+        latest.refresh_from_db()
+        self.assertEqual(len({older.file.name, newer.file.name, latest.file.name}), 3)
+
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        export_menu(path)
+        expected, actual = load_workbook(path), load_workbook(latest.file.path)
+        self.assertEqual(actual.sheetnames, expected.sheetnames)
+        for name in expected.sheetnames:
+            self.assertEqual([[cell.value for cell in row] for row in actual[name].iter_rows()],
+                             [[cell.value for cell in row] for row in expected[name].iter_rows()])
+
+    def test_failed_job_keeps_error(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            menu = Menu.objects.create(imported_file='missing.xlsx')
+        job = menu.jobs.get()
+        self.assertEqual(job.status, Job.StatusChoices.FAILED)
+        self.assertTrue(job.error)
+
+
+class FinalProductAdminTest(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        FinalPriceHistory.objects.create(final_product=self.kebab, sell_price=1000)
+
+    def add_products(self, count, menu_price):
+        for i in range(count):
+            product = FinalProduct.objects.create(name=f'غذا {menu_price} {i}')
+            with self.commit():
+                product.ingredients.add(self.meat_half, self.rice_double)
+            FinalPriceHistory.objects.create(final_product=product, sell_price=menu_price)
+
+    def changelist(self, **params):
+        return self.client.get(reverse('admin:product_finalproduct_changelist'), params)
+
+    def test_changelist_query_count_is_constant(self):
+        self.add_products(2, 2000)
+        with CaptureQueriesContext(connection) as few:
+            self.changelist()
+        self.add_products(20, 2000)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.changelist().status_code, 200)
+        self.assertEqual(len(few), len(many))
+
+    def test_profit_filters_and_ordering(self):
+        self.add_products(1, 2000)
+        self.add_products(1, 1200)
+        loss = self.changelist(profit='loss').context['cl'].queryset
+        self.assertEqual([p.name for p in loss], ['چلوکباب'])
+        low = self.changelist(profit='low').context['cl'].queryset
+        self.assertEqual([p.profit for p in low], [100])
+
+        ordered = self.changelist(o='4').context['cl'].queryset
+        self.assertEqual([p.profit for p in ordered], [-100, 100, 900])
+
+
+class SellPriceHistoryAdminTest(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+
+    def changelist(self, **params):
+        return self.client.get(reverse('admin:product_sellpricehistory_changelist'), params)
+
+    def test_menu_price_is_resolved_as_of_each_snapshot(self):
+        FinalPriceHistory.objects.create(final_product=self.kebab, sell_price=1000)
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.meat, unit_price=2000)
+        FinalPriceHistory.objects.create(final_product=self.kebab, sell_price=2000)
+        SellPriceHistory.objects.filter(sell_price=1600).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        FinalPriceHistory.objects.filter(sell_price=1000).update(created_at=timezone.now() - datetime.timedelta(hours=2))
+
+        rows = {row.sell_price: row for row in self.changelist().context['cl'].queryset}
+        self.assertEqual((rows[1600].menu_price, rows[1600].profit), (1000, -600))
+        self.assertEqual((rows[1100].menu_price, rows[1100].profit), (2000, 900))
+        self.assertEqual([row.sell_price for row in self.changelist(profit='loss').context['cl'].queryset], [1600])
+
+    def test_changelist_query_count_is_constant(self):
+        FinalPriceHistory.objects.create(final_product=self.kebab, sell_price=1000)
+        with CaptureQueriesContext(connection) as few:
+            self.changelist()
+        for price in range(1000, 1020):
+            with self.commit():
+                PriceHistory.objects.create(ingredient=self.rice, unit_price=price)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.changelist().status_code, 200)
+        self.assertEqual(len(few), len(many))
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class HistoryQueryPlanTest(RecipeTestCase):
+    # subqueries alias their tables as U0, U1, ...
+    history_tables = r'(product_(pricehistory|sellpricehistory|finalpricehistory)|U\d+)'
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndexes(self, queryset):
+        plan = self.query_plan(queryset)
+        for step in plan:
+            self.assertNotRegex(step, rf'^SCAN {self.history_tables}$', plan)
+            self.assertNotIn('TEMP B-TREE', step, plan)
+        self.assertTrue(any(re.match(rf'(SEARCH|SCAN) {self.history_tables} USING', step) for step in plan), plan)
+
+    def test_latest_row_lookups(self):
+        self.assertUsesIndexes(PriceHistory.objects.filter(ingredient=self.meat).order_by('-created_at')[:1])
+        for model in (SellPriceHistory, FinalPriceHistory):
+            self.assertUsesIndexes(
+                model.objects.filter(final_product=self.kebab, sell_price__gt=0).order_by('-created_at')[:1])
+
+    def test_latest_row_annotations(self):
+        self.assertUsesIndexes(PrimaryIngredient.objects.annotate(last_price=last_price_subquery()).order_by())
+        self.assertUsesIndexes(FinalProduct.objects.annotate(
+            last_sell_price=last_product_price_subquery(SellPriceHistory)).order_by())
+        self.assertUsesIndexes(annotate_product_prices(FinalProduct.objects.order_by()))
+
+    def test_as_of_menu_price_annotation(self):
+        queryset = annotate_sell_price_history(SellPriceHistory.objects.order_by('-created_at', '-pk'))
+        self.assertUsesIndexes(queryset[:100])
+
+    def test_changelist_ordering(self):
+        for model in (PriceHistory, SellPriceHistory):
+            self.assertUsesIndexes(model.objects.order_by('-created_at', '-pk')[:100])
+
+
+class CompactionTest(RecipeTestCase):
+    def old_row(self, model, days_ago, hour, **fields):
+        row = model.objects.create(**fields)
+        created_at = (timezone.now() - datetime.timedelta(days=days_ago)).replace(hour=hour)
+        model.objects.filter(pk=row.pk).update(created_at=created_at)
+        return row
+
+    def test_old_rows_collapse_to_last_of_day(self):
+        first = self.old_row(PriceHistory, 100, 10, ingredient=self.meat, unit_price=1100)
+        self.old_row(PriceHistory, 100, 12, ingredient=self.meat, unit_price=1200)
+        self.old_row(PriceHistory, 99, 10, ingredient=self.meat, unit_price=1300)
+        self.old_row(SellPriceHistory, 100, 10, final_product=self.kebab, sell_price=900)
+        self.old_row(SellPriceHistory, 100, 12, final_product=self.kebab, sell_price=950)
+        PrimaryIngredient.objects.filter(pk=self.meat.pk).update(current_price=1000)
+
+        out = StringIO()
+        version = api_version()
+        call_command('compact_history', '--keep-days', '90', '--chunk-size', '1', stdout=out)
+        self.assertGreater(api_version(), version)
+        self.assertIn('price_history: 1 rows archived.', out.getvalue())
+        self.assertIn('sell_price_history: 1 rows archived.', out.getvalue())
+
+        archived = PriceHistoryArchive.objects.get()
+        self.assertEqual((archived.ingredient, archived.unit_price), (self.meat, 1100))
+        self.assertEqual(archived.created_at.hour, 10)
+        self.assertFalse(PriceHistory.objects.filter(pk=first.pk).exists())
+        self.assertEqual(SellPriceHistoryArchive.objects.get().sell_price, 900)
+        self.assertEqual(sorted(PriceHistory.objects.filter(ingredient=self.meat).values_list('unit_price', flat=True)),
+                         [1000, 1200, 1300])
+        self.assertEqual(PrimaryIngredient.objects.get(pk=self.meat.pk).current_price, 1000)
+
+    def test_weeks_start_on_saturday(self):
+        saturday = timezone.make_aware(datetime.datetime(2024, 1, 6, 12))
+        for days in range(7):
+            self.assertEqual(period_start(saturday + datetime.timedelta(days=days), 'week'), saturday.date())
+
+
+class ApiTest(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('product:product_list')
+        self.client.force_login(User.objects.create_user('staff', password='staff', is_staff=True))
+
+    def test_requires_staff_session_or_token(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.client.force_login(User.objects.create_user('cashier', password='cashier'))
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.client.logout()
+        with override_settings(API_TOKENS=['secret']):
+            self.assertEqual(self.client.get(self.url, headers={'Authorization': 'Token wrong'}).status_code, 401)
+            self.assertEqual(self.client.get(self.url, headers={'Authorization': 'Token secret'}).status_code, 200)
+
+    def test_deleted_history_changes_etag(self):
+        with self.commit():
+            price = PriceHistory.objects.create(ingredient=self.meat, unit_price=1500)
+        response = self.client.get(self.url)
+        with self.commit():
+            price.delete()
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+    def test_product_list_with_breakdown(self):
+        FinalPriceHistory.objects.create(final_product=self.kebab, sell_price=1500)
+        product = self.client.get(self.url).json()['products'][0]
+        self.assertEqual((product['name'], product['cost'], product['menu_price'], product['profit']),
+                         ('چلوکباب', 1100, 1500, 400))
+        self.assertCountEqual([(i['name'], i['unit_amount'], i['cost']) for i in product['ingredients']],
+                              [('گوشت', 0.5, 500), ('برنج', 2, 600)])
+        self.assertEqual(self.client.get(reverse('product:product_detail', args=[self.kebab.pk])).json()['cost'], 1100)
+
+    def test_conditional_get_and_server_cache(self):
+        response = self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertEqual(self.client.get(
+            self.url, headers={'If-Modified-Since': response['Last-Modified']}).status_code, 304)
+        # the session and its user, the API version, then the history timestamps
+        with self.assertNumQueries(6):
+            self.assertEqual(self.client.get(self.url).content, response.content)
+
+        with self.commit():
+            PriceHistory.objects.create(ingredient=self.meat, unit_price=1500)
+        changed = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['products'][0]['cost'], 1350)
+
+    def test_version_is_read_from_the_database(self):
+        response = self.client.get(self.url)
+        # a recipe edit in another process: no signals here, only the version bumps it writes
+        MiddleIngredient.objects.filter(pk=self.meat_half.pk).update(unit_amount=1)
+        FinalProduct.objects.filter(pk=self.kebab.pk).update(breakdown_version=F('breakdown_version') + 1)
+        CacheVersion.objects.update_or_create(name='api', defaults={'version': api_version() + 1})
+        changed = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['products'][0]['ingredients'][0]['unit_amount'], 1)
+
+    def test_recipe_edit_invalidates_cache(self):
+        response = self.client.get(self.url)
+        with self.commit():
+            self.kebab.ingredients.remove(self.rice_double)
+        changed = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(len(changed.json()['products'][0]['ingredients']), 1)
+
+    def test_ingredient_price_history(self):
+        PriceHistory.objects.create(ingredient=self.meat, unit_price=1200)
+        url = reverse('product:ingredient_price_history', args=[self.meat.pk])
+        data = self.client.get(url, {'limit': 1}).json()
+        self.assertEqual((data['current_price'], [row['price'] for row in data['history']]), (1200, [1200]))
+        self.assertEqual(self.client.get(reverse('product:ingredient_price_history', args=[0])).status_code, 404)
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+
+class NormalizedNameSearchTest(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        self.sauce = PrimaryIngredient.objects.create(name='سس‌ كچاپ ۲', unit=self.meat.unit)
+
+    def search(self, model, term):
+        return list(self.client.get(reverse(f'admin:product_{model}_changelist'), {'q': term}).context['cl'].queryset)
+
+    def test_names_are_folded(self):
+        self.assertEqual(self.sauce.normalized_name, 'سس کچاپ 2')
+        self.assertEqual(normalize_name(' كيك\u200cها  ٣ '), 'کیک ها 3')
+
+    def test_prefix_and_substring_search(self):
+        self.assertEqual(self.search('primaryingredient', 'سس کچ'), [self.sauce])
+        self.assertEqual(self.search('primaryingredient', 'كچاپ 2'), [self.sauce])
+        self.assertEqual(self.search('finalproduct', 'چلو'), [self.kebab])
+        self.assertEqual(len(self.search('middleingredient', 'گوشت')), 1)
+        self.assertEqual([row.unit_price for row in self.search('pricehistory', 'برنج')], [300])
+        self.assertTrue(self.search('sellpricehistory', 'چلوکباب'))
+        self.assertEqual(self.search('primaryingredient', 'ماست'), [])
+
+    def test_prefix_matches_do_not_hide_substring_matches(self):
+        spicy = PrimaryIngredient.objects.create(name='کچاپ تند', unit=self.meat.unit)
+        self.assertCountEqual(self.search('primaryingredient', 'کچاپ'), [spicy, self.sauce])
+        self.assertEqual(self.search('primaryingredient', 'کچ'), [spicy])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+    def test_prefix_lookup_uses_index(self):
+        sql, params = PrimaryIngredient.objects.filter(
+            normalized_name__gte='سس', normalized_name__lt='سس' + PREFIX_END).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('normalized_name', plan)
+        self.assertIn('INDEX', plan)
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True)
+class InstrumentationTest(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        clear_records()
+
+    def test_signal_receivers_and_requests_are_recorded(self):
+        PriceHistory.objects.create(ingredient=self.meat, unit_price=2000)
+        names = {record['name'] for record in get_records() if record['kind'] == 'signal'}
+        self.assertIn('product.signals.update_final_product', names)
+
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        self.client.get(reverse('admin:product_finalproduct_changelist'))
+        request = [record for record in get_records() if record['kind'] == 'request'][-1]
+        self.assertEqual(request['name'], 'GET ' + reverse('admin:product_finalproduct_changelist'))
+        self.assertGreater(request['queries'], 0)
+
+    def test_duplicates_and_n_plus_one(self):
+        def per_ingredient_queries():
+            for ingredient in PrimaryIngredient.objects.all():
+                list(PriceHistory.objects.filter(ingredient=ingredient))
+            for _ in range(5):
+                list(PriceHistory.objects.filter(ingredient=self.meat))
+
+        measure('test', 'loop', per_ingredient_queries)
+        record = get_records()[-1]
+        self.assertEqual(record['queries'], 8)
+        self.assertEqual(record['duplicates'], 5)
+        self.assertEqual(len(record['n_plus_one']), 1)
+        self.assertEqual(record['n_plus_one'][0][1], 7)
+        self.assertEqual(normalize_sql("WHERE id IN (1, 2, 3) AND name = 'x'"), 'WHERE id IN (...) AND name = ?')
+
+    def test_page_is_superuser_only(self):
+        url = reverse('admin_instrumentation')
+        self.client.force_login(User.objects.create_user('staff', password='staff', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class NumericPriceMigrationTest(SimpleTestCase):
+    def test_clean_price(self):
+        migration = importlib.import_module('product.migrations.0004_numeric_unit_price')
+        self.assertEqual(migration.clean_price('۱٬۲۵۰'), 1250)
+        self.assertEqual(migration.clean_price('1,000.0'), 1000)
+        for value in ('نامعتبر', '-5'):
+            with self.assertRaises(ValueError):
+                migration.clean_price(value)
+
+
+class StartupImportTest(SimpleTestCase):
+    heavy_modules = {'pandas', 'numpy', 'openpyxl', 'xlsxwriter', 'pyarrow'}
+    # seconds of module import time for django.setup() and the URLconf; a few times what it takes today
+    budget = 3
+
+    def test_startup_does_not_import_heavy_libraries(self):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'RestaurantAccountancy.settings',
+               'SECRET_KEY': os.environ.get('SECRET_KEY', 'x')}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import django; django.setup(); import RestaurantAccountancy.urls'],
+            capture_output=True, text=True, env=env)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        timings = [line.split('|') for line in result.stderr.splitlines()
+                   if line.startswith('import time:') and 'self [us]' not in line]
+        modules = {name.strip().split('.')[0] for _, _, name in timings}
+        self.assertFalse(modules & self.heavy_modules)
+        self.assertLess(sum(int(own.split(':')[1]) for own, _, _ in timings) / 1e6, self.budget)
+
+    def test_formats_load_on_use(self):
+        self.assertEqual(get_importer('prices.XLSX'), stage_excel)
+        self.assertEqual(get_importer('prices.csv'), stage_csv)
+        self.assertEqual(get_exporter('xlsx'), export_menu)
+        self.assertEqual(get_exporter('csv_zip'), export_csv_bundle)
+        self.assertEqual(export_extension('csv_zip'), 'zip')
+        with self.assertRaises(Exception):
+            get_importer('prices.txt')
+
+
+class DatabaseProfileTest(SimpleTestCase):
+    databases = {'default'}
+
+    def test_sqlite_connections_use_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    def test_writers_are_not_locked_out_by_exports(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # the test database lives in memory, so run against a real WAL database file
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'RestaurantAccountancy.settings', 'DB_ENGINE': 'sqlite',
+               'DB_NAME': os.path.join(directory, 'db.sqlite3'), 'SECRET_KEY': os.environ.get('SECRET_KEY', 'x')}
+
+        def manage(*command):
+            result = subprocess.run([sys.executable, 'manage.py', *command], capture_output=True, text=True, env=env,
+                                    cwd=settings.BASE_DIR)
+            self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+            return result.stdout
+
+        count_rows = ('from product.models import *; print([model.objects.count() for model in '
+                      '(PriceHistory, SellPriceHistory, FinalPriceHistory)])')
+        manage('migrate')
+        refused = subprocess.run([sys.executable, 'manage.py', 'stress_db', '--seconds', '0.1'], capture_output=True,
+                                 text=True, env=env, cwd=settings.BASE_DIR)
+        self.assertNotEqual(refused.returncode, 0)
+        self.assertIn('--scratch', refused.stderr)
+        manage('stress_db', '--scratch', '--seed', '--writers', '1', '--seconds', '0.1')
+        manage('shell', '-c', 'from product.models import *; PrimaryIngredient.objects.create(name="بی قیمت")')
+        before = manage('shell', '-c', count_rows)
+        report = json.loads(manage('stress_db', '--scratch', '--writers', '4', '--seconds', '2',
+                                   '--max-lock-errors', '0'))
+        self.assertGreater(report['writes'], 0)
+        self.assertEqual(report['lock_errors'], 0)
+        # nothing written by the run is left behind
+        self.assertEqual(manage('shell', '-c', count_rows), before)
+
+
+class BenchmarkTest(TestCase):
+    def test_small_run_reports_every_measurement(self):
+        invalidate_cost_graph()
+        report = run_benchmarks(ingredients=12, recipes=5, ingredients_per_recipe=3, history_depth=2)
+        self.assertEqual(set(report['results']), {'price_change_fanout', 'import_from_excel', 'export_data',
+                                                  'finalproduct_changelist', 'sellpricehistory_changelist'})
+        for result in report['results'].values():
+            self.assertEqual(set(result), {'wall_time', 'queries', 'peak_memory'})
+        self.assertEqual(compare(report, report), [])
+
+        slower = {'results': {'export_data': {'wall_time': 0.0, 'queries': 1, 'peak_memory': 0}}}
+        self.assertEqual(len(compare(report, slower)), 3)
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from product import views
+
+app_name = 'product'
+
+urlpatterns = [
+    path('products/', views.product_list, name='product_list'),
+    path('products/<int:pk>/', views.product_detail, name='product_detail'),
+    path('ingredients/<int:pk>/prices/', views.ingredient_price_history, name='ingredient_price_history'),
+]
@@ -1,3 +1,74 @@
-from django.shortcuts import render
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db.models import Max
+from django.shortcuts import redirect, get_object_or_404
+from django.template.response import TemplateResponse
 
-# Create your views here.
+from product.models import FinalProduct, PrimaryIngredient, PriceHistory
+from utils.api_cache import cached_api_view, latest_history_change
+from utils.cost_cache import get_breakdowns, get_breakdown, cost_cache_stats
+from utils.instrumentation import get_records, clear_records, worst_offenders, n_plus_one_patterns
+
+MAX_HISTORY_ROWS = 1000
+
+
+def instrumentation_view(request):
+    if not request.user.is_superuser:
+        raise PermissionDenied
+    if request.method == 'POST':
+        clear_records()
+        return redirect('admin_instrumentation')
+    records = get_records()
+    context = {
+        **admin.site.each_context(request),
+        'title': 'گزارش کوئری ها و زمان اجرا',
+        'records_count': len(records),
+        'by_queries': worst_offenders(records, 'queries'),
+        'by_wall_time': worst_offenders(records, 'wall_time'),
+        'n_plus_one': n_plus_one_patterns(records),
+        'cost_cache': cost_cache_stats(),
+    }
+    return TemplateResponse(request, 'admin/instrumentation.html', context)
+
+
+def serialize_product(product, breakdown):
+    return {
+        'id': product.pk,
+        'name': product.name,
+        'cost': product.current_cost,
+        'menu_price': product.current_menu_price,
+        'profit': product.current_profit,
+        'ingredients': breakdown['ingredients'],
+    }
+
+
+@cached_api_view(lambda request: latest_history_change())
+def product_list(request):
+    products = list(FinalProduct.objects.order_by('id'))
+    breakdowns = get_breakdowns([product.pk for product in products])
+    return {'products': [serialize_product(product, breakdowns[product.pk]) for product in products]}
+
+
+@cached_api_view(lambda request, pk: latest_history_change())
+def product_detail(request, pk):
+    product = get_object_or_404(FinalProduct, pk=pk)
+    return serialize_product(product, get_breakdown(product.pk))
+
+
+@cached_api_view(lambda request, pk: PriceHistory.objects.filter(ingredient_id=pk).aggregate(
+    latest=Max('created_at'))['latest'])
+def ingredient_price_history(request, pk):
+    ingredient = get_object_or_404(PrimaryIngredient.objects.select_related('unit'), pk=pk)
+    try:
+        limit = min(int(request.GET.get('limit', 100)), MAX_HISTORY_ROWS)
+    except ValueError:
+        limit = 100
+    return {
+        'id': ingredient.pk,
+        'name': ingredient.name,
+        'unit': ingredient.unit.title if ingredient.unit else None,
+        'current_price': ingredient.current_price,
+        'history': [{'price': price, 'created_at': created_at} for price, created_at in
+                    ingredient.price_history.order_by('-created_at', '-id').values_list(
+                        'unit_price', 'created_at')[:limit]],
+    }
@@ -0,0 +1,93 @@
+import functools
+import hmac
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, F
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from product.models import PriceHistory, SellPriceHistory, FinalPriceHistory, CacheVersion
+
+VERSION_NAME = 'api'
+
+
+def api_version():
+    return CacheVersion.objects.filter(name=VERSION_NAME).values_list('version', flat=True).first() or 0
+
+
+def invalidate_api_cache():
+    """
+    Drop every cached API response, e.g. after a recipe edit that no history timestamp reflects. The version is kept
+    in the database, so responses cached by other processes go stale too.
+    """
+    if not CacheVersion.objects.filter(name=VERSION_NAME).update(version=F('version') + 1):
+        CacheVersion.objects.get_or_create(name=VERSION_NAME, defaults={'version': 1})
+
+
+def api_authorized(request):
+    """A staff session, or an "Authorization: Token <token>" header with one of settings.API_TOKENS."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'token' and any(
+        hmac.compare_digest(token.strip(), api_token) for api_token in settings.API_TOKENS)
+
+
+def api_auth_required(view):
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not api_authorized(request):
+            return JsonResponse({'detail': 'احراز هویت انجام نشده است'}, status=401,
+                                json_dumps_params={'ensure_ascii': False})
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def latest_history_change():
+    timestamps = [model.objects.aggregate(latest=Max('created_at'))['latest']
+                  for model in (PriceHistory, SellPriceHistory, FinalPriceHistory)]
+    return max(filter(None, timestamps), default=None)
+
+
+def cached_api_view(last_modified_func):
+    """
+    Serve a view that returns a JSON-serializable payload with ETag/Last-Modified conditional GETs and a server-side
+    cache of the rendered response. Both are keyed on the API version and last_modified_func(request, *args,
+    **kwargs), the latest history timestamp behind the response, so a price change or invalidate_api_cache() in any
+    process makes them stale.
+    Only api_authorized() requests are served.
+    """
+
+    def decorator(view):
+        def state(request, *args, **kwargs):
+            if not hasattr(request, '_api_state'):
+                request._api_state = api_version(), last_modified_func(request, *args, **kwargs)
+            return request._api_state
+
+        def etag(request, *args, **kwargs):
+            version, last_modified = state(request, *args, **kwargs)
+            return f'{version}-{last_modified.timestamp() if last_modified else 0}'
+
+        def last_modified(request, *args, **kwargs):
+            return state(request, *args, **kwargs)[1]
+
+        @functools.wraps(view)
+        @api_auth_required
+        @require_GET
+        @condition(etag_func=etag, last_modified_func=last_modified)
+        def wrapper(request, *args, **kwargs):
+            key = f'api:{etag(request, *args, **kwargs)}:{request.get_full_path()}'
+            content = cache.get(key)
+            if content is None:
+                response = view(request, *args, **kwargs)
+                if not isinstance(response, dict):
+                    return response
+                content = JsonResponse(response, json_dumps_params={'ensure_ascii': False}).content
+                cache.set(key, content, settings.API_CACHE_TIMEOUT)
+            return HttpResponse(content, content_type='application/json')
+
+        return wrapper
+
+    return decorator
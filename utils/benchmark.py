@@ -0,0 +1,152 @@
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from openpyxl import Workbook
+
+from product.models import Unit, PrimaryIngredient, PriceHistory, MiddleIngredient, FinalProduct, SellPriceHistory, \
+    FinalPriceHistory
+from utils.cost_graph import invalidate_cost_graph, get_cost_graph, flush_price_changes
+from utils.current_prices import rebuild_current_prices
+from utils.export import export_menu
+from utils.text import normalize_name
+from utils.importers import import_from_excel
+
+DEFAULT_SIZES = {'ingredients': 200, 'recipes': 100, 'ingredients_per_recipe': 8, 'history_depth': 5}
+
+
+def generate_data(ingredients=200, recipes=100, ingredients_per_recipe=8, history_depth=5, seed=0):
+    """Create a synthetic catalogue with bulk_create (no signals) and return the generated ingredients."""
+    rnd = random.Random(seed)
+    unit = Unit.objects.create(title='کیلوگرم')
+    primaries = PrimaryIngredient.objects.bulk_create(
+        [PrimaryIngredient(name=f'ماده اولیه {i}', unit=unit, normalized_name=normalize_name(f'ماده اولیه {i}'))
+         for i in range(ingredients)])
+    PriceHistory.objects.bulk_create(
+        [PriceHistory(ingredient=primary, unit_price=rnd.randint(1, 500) * 1000)
+         for _ in range(history_depth) for primary in primaries])
+
+    products = FinalProduct.objects.bulk_create(
+        [FinalProduct(name=f'محصول نهایی {i}', normalized_name=normalize_name(f'محصول نهایی {i}'))
+         for i in range(recipes)])
+    lines = []
+    for product in products:
+        for primary in rnd.sample(primaries, min(ingredients_per_recipe, len(primaries))):
+            lines.append((product, MiddleIngredient(base_ingredient=primary, unit_amount=rnd.randint(1, 20) / 10)))
+    MiddleIngredient.objects.bulk_create([middle for _, middle in lines])
+    FinalProduct.ingredients.through.objects.bulk_create(
+        [FinalProduct.ingredients.through(finalproduct_id=product.pk, middleingredient_id=middle.pk)
+         for product, middle in lines])
+
+    invalidate_cost_graph()
+    graph = get_cost_graph()
+    for model, markup in ((SellPriceHistory, 1), (FinalPriceHistory, 1.3)):
+        model.objects.bulk_create(
+            [model(final_product=product, sell_price=int(graph.product_cost(product.pk) * markup * rnd.uniform(.8, 1.2)))
+             for _ in range(history_depth) for product in products])
+    rebuild_current_prices()
+    return primaries
+
+
+def measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        wall_time = time.perf_counter() - started
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'wall_time': round(wall_time, 4), 'queries': len(queries), 'peak_memory': peak_memory}
+
+
+def price_list(primaries, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Page 1'
+    ws.append(['لیست قیمت'])
+    ws.append(['ردیف', 'نام کالا', 'واحد', 'قیمت'])
+    for i, primary in enumerate(primaries[:rows], start=1):
+        ws.append([i, primary.name, 'کیلوگرم', 1000 + i])
+    for i in range(len(primaries), rows):
+        ws.append([i, f'ماده جدید {i}', 'بسته', 1000 + i])
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    wb.save(path)
+    return path
+
+
+def run_benchmarks(**sizes):
+    """Generate data and time the hot paths. Meant to run inside a transaction that is rolled back afterwards."""
+    sizes = {**DEFAULT_SIZES, **sizes}
+    primaries = generate_data(**sizes)
+    most_used = max(primaries, key=lambda primary: primary.middle_ingredients.count())
+    client = Client()
+    client.force_login(User.objects.create_superuser(f'benchmark-{time.time_ns()}', password='benchmark'))
+    results = {}
+
+    invalidate_cost_graph()
+    get_cost_graph()
+
+    def price_change():
+        # the benchmark transaction is never committed, so run the on_commit propagation here
+        PriceHistory.objects.create(ingredient=most_used, unit_price=1)
+        flush_price_changes()
+
+    results['price_change_fanout'] = measure(price_change)
+
+    path = price_list(primaries, sizes['ingredients'] + sizes['ingredients'] // 10)
+    try:
+        results['import_from_excel'] = measure(lambda: import_from_excel(SimpleNamespace(path=path)))
+    finally:
+        os.remove(path)
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        results['export_data'] = measure(lambda: export_menu(path))
+    finally:
+        os.remove(path)
+
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        for name in ('finalproduct', 'sellpricehistory'):
+            url = reverse(f'admin:product_{name}_changelist')
+            results[f'{name}_changelist'] = measure(lambda: client.get(url))
+    return {'sizes': sizes, 'results': results}
+
+
+def compare(report, baseline, tolerance=0.5):
+    """Return the measurements that got slower than the baseline by more than tolerance, or ran more queries."""
+    regressions = []
+    for name, result in report['results'].items():
+        expected = baseline.get('results', {}).get(name)
+        if not expected:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append(f"{name}: {result['queries']} queries, baseline {expected['queries']}")
+        if result['wall_time'] > expected['wall_time'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['wall_time']}s, baseline {expected['wall_time']}s")
+        if result['peak_memory'] > expected['peak_memory'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['peak_memory']} bytes peak, baseline {expected['peak_memory']}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(report, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,77 @@
+import datetime
+import time
+
+from django.db import transaction, connection
+from django.utils import timezone
+
+from product.models import PriceHistory, PriceHistoryArchive, SellPriceHistory, SellPriceHistoryArchive
+from utils.api_cache import invalidate_api_cache
+
+# (history model, archive model, entity field, value field)
+HISTORY_TABLES = {
+    'price_history': (PriceHistory, PriceHistoryArchive, 'ingredient_id', 'unit_price'),
+    'sell_price_history': (SellPriceHistory, SellPriceHistoryArchive, 'final_product_id', 'sell_price'),
+}
+ENTITY_BATCH = 100
+
+
+def period_start(created_at, period):
+    day = timezone.localtime(created_at).date()
+    if period == 'week':
+        # weeks start on Saturday
+        return day - datetime.timedelta(days=(day.weekday() - 5) % 7)
+    return day
+
+
+def rows_to_archive(rows, period):
+    """
+    Rows (id, entity id, created_at, value) ordered by entity and created_at that are not the last row of their
+    entity in their period.
+    """
+    last_of_period = {}
+    for row in rows:
+        key = row[1], period_start(row[2], period)
+        previous = last_of_period.get(key)
+        last_of_period[key] = row
+        if previous:
+            yield previous
+
+
+def archive_rows(model, archive_model, entity_field, value_field, rows):
+    with transaction.atomic():
+        archive_model.objects.bulk_create(
+            [archive_model(**{entity_field: entity_id, value_field: value, 'created_at': created_at})
+             for _, entity_id, created_at, value in rows])
+        # the latest row of every entity stays, so current prices do not change and no signal has to run
+        ids = [row[0] for row in rows]
+        table = connection.ops.quote_name(model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(ids))})', ids)
+
+
+def compact_history(table, keep_days=90, period='day', chunk_size=500, pause=0.0):
+    """
+    Move the rows of a history table older than keep_days into its archive table, except the last row of every
+    entity per day or week. Each chunk of at most chunk_size rows is archived in its own short transaction, so
+    SQLite is never write-locked for long; pause sleeps between chunks to let other writers in.
+    """
+    model, archive_model, entity_field, value_field = HISTORY_TABLES[table]
+    cutoff = timezone.now() - datetime.timedelta(days=keep_days)
+    old_rows = model.objects.filter(created_at__lt=cutoff)
+    entity_ids = list(old_rows.order_by(entity_field).values_list(entity_field, flat=True).distinct())
+
+    archived = 0
+    for start in range(0, len(entity_ids), ENTITY_BATCH):
+        rows = old_rows.filter(**{f'{entity_field}__in': entity_ids[start:start + ENTITY_BATCH]}).order_by(
+            entity_field, 'created_at', 'id').values_list('id', entity_field, 'created_at', value_field)
+        # read the batch before deleting from the table it comes from
+        rows = list(rows_to_archive(list(rows), period))
+        for offset in range(0, len(rows), chunk_size):
+            chunk = rows[offset:offset + chunk_size]
+            archive_rows(model, archive_model, entity_field, value_field, chunk)
+            archived += len(chunk)
+            time.sleep(pause)
+    if archived:
+        # the history timestamps behind the API's ETags do not change when rows move to the archive
+        invalidate_api_cache()
+    return archived
@@ -0,0 +1,97 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from product.models import FinalProduct
+
+HITS_KEY = 'cost:stats:hits'
+MISSES_KEY = 'cost:stats:misses'
+
+
+def breakdown_key(product_id, version):
+    return f'cost:breakdown:{product_id}:{version}'
+
+
+def new_version():
+    # a fresh token rather than a counter, so an old version never comes back with an old entry
+    return time.time_ns()
+
+
+def product_versions(product_ids):
+    return dict(FinalProduct.objects.filter(pk__in=product_ids).values_list('id', 'breakdown_version'))
+
+
+def bump_product_versions(product_ids=None):
+    """Make the cached breakdowns of the given products (all if None) stale, in every process."""
+    queryset = FinalProduct.objects.all() if product_ids is None else FinalProduct.objects.filter(pk__in=product_ids)
+    if product_ids is None or product_ids:
+        queryset.update(breakdown_version=new_version())
+
+
+def count(key, amount):
+    if amount:
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, None)
+
+
+def compute_breakdowns(product_ids):
+    breakdowns = {product_id: {'cost': 0, 'ingredients': []} for product_id in product_ids}
+    lines = FinalProduct.ingredients.through.objects.filter(finalproduct_id__in=product_ids).select_related(
+        'middleingredient__base_ingredient__unit').order_by('middleingredient_id')
+    for line in lines:
+        middle = line.middleingredient
+        ingredient = middle.base_ingredient
+        cost = int((ingredient.current_price or 0) * middle.unit_amount)
+        breakdown = breakdowns[line.finalproduct_id]
+        breakdown['cost'] += cost
+        breakdown['ingredients'].append({
+            'id': ingredient.pk,
+            'name': ingredient.name,
+            'unit': ingredient.unit.title if ingredient.unit else None,
+            'unit_amount': middle.unit_amount,
+            'unit_price': ingredient.current_price,
+            'cost': cost,
+        })
+    return breakdowns
+
+
+def get_breakdowns(product_ids):
+    """
+    {product id: {'cost': ..., 'ingredients': [...]}} for the given products. Breakdowns are cached under the
+    breakdown_version column of their product, which every change bumps in the database, so a per-process cache
+    (locmem) never serves a breakdown older than the product row. Only the ones missing from the cache are computed,
+    with a single query.
+    """
+    versions = product_versions(product_ids)
+    keys = {product_id: breakdown_key(product_id, version) for product_id, version in versions.items()}
+    cached = cache.get_many(keys.values())
+    breakdowns = {product_id: cached[key] for product_id, key in keys.items() if key in cached}
+    missing = [product_id for product_id in product_ids if product_id not in breakdowns]
+    if missing:
+        computed = compute_breakdowns(missing)
+        # a product deleted meanwhile has no version and is not cached
+        cache.set_many({keys[product_id]: breakdown for product_id, breakdown in computed.items()
+                        if product_id in keys}, settings.COST_CACHE_TIMEOUT)
+        breakdowns.update(computed)
+    count(HITS_KEY, len(product_ids) - len(missing))
+    count(MISSES_KEY, len(missing))
+    return breakdowns
+
+
+def get_breakdown(product_id):
+    return get_breakdowns([product_id])[product_id]
+
+
+def cost_cache_stats():
+    stats = defaultdict(int, cache.get_many([HITS_KEY, MISSES_KEY]))
+    hits, misses = stats[HITS_KEY], stats[MISSES_KEY]
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else None}
+
+
+def reset_cost_cache_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,293 @@
+import threading
+from collections import defaultdict
+
+from django.db import transaction, connection
+from django.db.models import Max, Count, F, Value, BigIntegerField
+from django.db.models.functions import Cast, Floor, Coalesce
+from django.dispatch import Signal
+
+from product.models import PrimaryIngredient, PriceHistory, MiddleIngredient, FinalProduct, SellPriceHistory
+from utils.cost_cache import bump_product_versions
+from utils.current_prices import sync_ingredient_prices, sync_product_prices, last_price_subquery
+
+
+def contribution_expression(prefix=''):
+    """Cost of a MiddleIngredient: current price of its base ingredient times its unit amount, rounded down."""
+    price = Coalesce(F(f'{prefix}base_ingredient__current_price'), Value(0))
+    return Cast(Floor(price * F(f'{prefix}unit_amount')), BigIntegerField())
+
+
+def price_history_state():
+    state = PriceHistory.objects.aggregate(last_id=Max('id'), rows=Count('id'))
+    return state['last_id'] or 0, state['rows']
+
+
+def recipe_marker():
+    """
+    Changes whenever a recipe changes in any process: the last update and row count of MiddleIngredient and the last
+    id and row count of the recipe (m2m) tables, read with one query.
+    """
+    middle = MiddleIngredient._meta.db_table
+    tables = [FinalProduct.ingredients.through._meta.db_table,
+              PrimaryIngredient.related_ingredient.through._meta.db_table]
+    columns = [f'(SELECT MAX(updated_at) FROM {middle})', f'(SELECT COUNT(*) FROM {middle})']
+    for table in tables:
+        columns += [f'(SELECT MAX(id) FROM {table})', f'(SELECT COUNT(*) FROM {table})']
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {", ".join(columns)}')
+        return tuple(cursor.fetchone())
+
+
+class RecipeCycleError(Exception):
+    """Raised when a recipe edit would make an ingredient part of its own recipe."""
+
+    def __init__(self, message='این ماده اولیه نمی تواند در فرمول ساخت خودش استفاده شود'):
+        super().__init__(message)
+
+
+class CostGraph:
+    """
+    In-memory model of the PrimaryIngredient -> MiddleIngredient -> FinalProduct DAG.
+
+    Every MiddleIngredient keeps its cost contribution (price of its base ingredient times its unit amount), and
+    every FinalProduct or composite PrimaryIngredient (one with related_ingredient) keeps the sum of the
+    contributions it is made of. A price change only pushes the difference of the touched contributions to the
+    nodes that use them. Composites may be made of other composites to any depth; resolve() re-prices the ones
+    downstream of a change once each, in topological order.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.prices = {}
+        self.middles = {}
+        self.contributions = {}
+        self.base_middles = defaultdict(set)
+        self.middle_products = defaultdict(set)
+        self.middle_composites = defaultdict(set)
+        self.product_costs = defaultdict(int)
+        self.composite_costs = defaultdict(int)
+        self.last_price_history_id = 0
+        self.price_rows = 0
+        self.marker = None
+
+    def load(self):
+        with self.lock:
+            self.marker = recipe_marker()
+            self.last_price_history_id, self.price_rows = price_history_state()
+            for ingredient_id, price in PrimaryIngredient.objects.values_list('id', 'current_price'):
+                self.prices[ingredient_id] = price or 0
+
+            middles = MiddleIngredient.objects.annotate(contribution=contribution_expression()).values_list(
+                'id', 'base_ingredient_id', 'unit_amount', 'contribution')
+            for middle_id, base_id, unit_amount, contribution in middles:
+                self.middles[middle_id] = (base_id, unit_amount)
+                self.base_middles[base_id].add(middle_id)
+                self.contributions[middle_id] = contribution
+
+            for product_id, middle_id in FinalProduct.ingredients.through.objects.values_list('finalproduct_id',
+                                                                                              'middleingredient_id'):
+                self.middle_products[middle_id].add(product_id)
+                self.product_costs[product_id] += self.contributions[middle_id]
+
+            for composite_id, middle_id in PrimaryIngredient.related_ingredient.through.objects.values_list(
+                    'primaryingredient_id', 'middleingredient_id'):
+                self.middle_composites[middle_id].add(composite_id)
+                self.composite_costs[composite_id] += self.contributions[middle_id]
+        return self
+
+    def copy(self):
+        """An independent copy for trying out price changes; the recipe structure is shared, it is not changed."""
+        with self.lock:
+            graph = CostGraph()
+            graph.middles, graph.base_middles = self.middles, self.base_middles
+            graph.middle_products, graph.middle_composites = self.middle_products, self.middle_composites
+            graph.prices, graph.contributions = dict(self.prices), dict(self.contributions)
+            graph.product_costs = defaultdict(int, self.product_costs)
+            graph.composite_costs = defaultdict(int, self.composite_costs)
+            graph.last_price_history_id, graph.price_rows = self.last_price_history_id, self.price_rows
+            graph.marker = self.marker
+            return graph
+
+    def sync(self):
+        """
+        Apply the price history rows written since the graph was loaded or last synced. When the table holds another
+        number of rows than the graph has seen, rows were deleted (or, on PostgreSQL, committed out of id order) by
+        some process, and every price is read again from the history.
+        """
+        with self.lock:
+            last_id, rows = price_history_state()
+            if last_id > self.last_price_history_id:
+                new_prices = PriceHistory.objects.filter(
+                    id__gt=self.last_price_history_id, id__lte=last_id).order_by('id').values_list(
+                    'ingredient_id', 'unit_price')
+                for ingredient_id, price in new_prices:
+                    self.set_price(ingredient_id, price)
+                    self.price_rows += 1
+                self.last_price_history_id = last_id
+            if rows != self.price_rows:
+                self.resync_prices()
+                self.price_rows = rows
+
+    def resync_prices(self):
+        with self.lock:
+            prices = PrimaryIngredient.objects.annotate(last_price=last_price_subquery()).values_list(
+                'id', 'last_price')
+            for ingredient_id, price in prices:
+                if (price or 0) != self.prices.get(ingredient_id, 0):
+                    self.set_price(ingredient_id, price or 0)
+
+    def set_price(self, ingredient_id, price):
+        with self.lock:
+            self.prices[ingredient_id] = price
+            for middle_id in self.base_middles.get(ingredient_id, ()):
+                contribution = int(price * self.middles[middle_id][1])
+                delta = contribution - self.contributions[middle_id]
+                if not delta:
+                    continue
+                self.contributions[middle_id] = contribution
+                for product_id in self.middle_products.get(middle_id, ()):
+                    self.product_costs[product_id] += delta
+                for composite_id in self.middle_composites.get(middle_id, ()):
+                    self.composite_costs[composite_id] += delta
+
+    def resolve(self, ingredient_ids):
+        """Re-price the composites downstream of the given ingredients and return {composite id: new price}."""
+        with self.lock:
+            changed = {}
+            for composite_id in self.composites_downstream(ingredient_ids):
+                cost = self.composite_cost(composite_id)
+                if cost != self.prices.get(composite_id):
+                    self.set_price(composite_id, cost)
+                    changed[composite_id] = cost
+            return changed
+
+    def reachable_composites(self, ingredient_ids):
+        reachable = set()
+        stack = list(ingredient_ids)
+        while stack:
+            for composite_id in self.composites_using(stack.pop()):
+                if composite_id not in reachable:
+                    reachable.add(composite_id)
+                    stack.append(composite_id)
+        return reachable
+
+    def composites_downstream(self, ingredient_ids):
+        """Composites that depend on the given ingredients in topological order, leaving out any on a cycle."""
+        reachable = self.reachable_composites(ingredient_ids)
+        pending = dict.fromkeys(reachable, 0)
+        for composite_id in reachable:
+            for parent_id in self.composites_using(composite_id):
+                pending[parent_id] += 1
+
+        order = []
+        ready = [composite_id for composite_id, count in pending.items() if not count]
+        while ready:
+            composite_id = ready.pop()
+            order.append(composite_id)
+            for parent_id in self.composites_using(composite_id):
+                pending[parent_id] -= 1
+                if not pending[parent_id]:
+                    ready.append(parent_id)
+        return order
+
+    def would_create_cycle(self, composite_id, middle_ids):
+        bases = {self.middles[middle_id][0] for middle_id in middle_ids if middle_id in self.middles}
+        return composite_id in bases or bool(bases & self.reachable_composites([composite_id]))
+
+    def check_recipe(self, composite_id, middle_ids):
+        if self.would_create_cycle(composite_id, middle_ids):
+            raise RecipeCycleError()
+
+    def products_using(self, ingredient_id):
+        return {product_id for middle_id in self.base_middles.get(ingredient_id, ())
+                for product_id in self.middle_products.get(middle_id, ())}
+
+    def composites_using(self, ingredient_id):
+        return {composite_id for middle_id in self.base_middles.get(ingredient_id, ())
+                for composite_id in self.middle_composites.get(middle_id, ())}
+
+    def product_cost(self, product_id):
+        return self.product_costs.get(product_id, 0)
+
+    def composite_cost(self, composite_id):
+        return self.composite_costs.get(composite_id, 0)
+
+    def cost_of(self, middle_ids):
+        return sum(self.contributions.get(middle_id, 0) for middle_id in middle_ids)
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_cost_graph():
+    """
+    The process' cost graph, rebuilt when a recipe was changed by another process (a job worker, another web
+    worker), which the signals of this process never see.
+    """
+    global _graph
+    with _graph_lock:
+        if _graph is None or _graph.marker != recipe_marker():
+            _graph = CostGraph().load()
+        graph = _graph
+    graph.sync()
+    return graph
+
+
+def invalidate_cost_graph():
+    global _graph
+    with _graph_lock:
+        _graph = None
+
+
+def propagate_price_changes(ingredient_ids, product_ids=()):
+    """
+    Recompute composite ingredients and final products once for a batch of price changes. A product only gets a new
+    SellPriceHistory row when its cost differs from its current one.
+    """
+    try:
+        graph = get_cost_graph()
+        composite_prices = graph.resolve(ingredient_ids)
+        price_rows = PriceHistory.objects.bulk_create(
+            [PriceHistory(ingredient_id=composite_id, signal_involved=False, unit_price=price)
+             for composite_id, price in composite_prices.items()])
+        sync_ingredient_prices(composite_prices)
+        graph.sync()
+
+        product_ids = set(product_ids) | {product_id for ingredient_id in set(ingredient_ids) | set(composite_prices)
+                                          for product_id in graph.products_using(ingredient_id)}
+        bump_product_versions(product_ids)
+        current_costs = dict(FinalProduct.objects.filter(pk__in=product_ids).values_list('id', 'current_cost'))
+        changed = [product_id for product_id, current_cost in current_costs.items()
+                   if graph.product_cost(product_id) > 0 and graph.product_cost(product_id) != current_cost]
+        sell_rows = SellPriceHistory.objects.bulk_create(
+            [SellPriceHistory(final_product_id=product_id, sell_price=graph.product_cost(product_id))
+             for product_id in changed])
+        sync_product_prices(changed)
+        prices_propagated.send(sender=CostGraph, rows=price_rows + sell_rows)
+    except Exception:
+        invalidate_cost_graph()
+        raise
+
+
+# bulk_create sends no post_save, so the history rows written by a propagation are announced with this
+prices_propagated = Signal()
+_pending = threading.local()
+
+
+def queue_price_changes(ingredient_ids=(), product_ids=()):
+    """
+    Collect price and recipe changes of the current transaction; they are propagated together once it commits
+    (right away outside a transaction). A callback is registered on every call so changes queued in a transaction
+    that was rolled back are still picked up by the next commit.
+    """
+    _pending.__dict__.setdefault('ingredient_ids', set()).update(ingredient_ids)
+    _pending.__dict__.setdefault('product_ids', set()).update(product_ids)
+    transaction.on_commit(flush_price_changes)
+
+
+def flush_price_changes():
+    ingredient_ids = _pending.__dict__.pop('ingredient_ids', set())
+    product_ids = _pending.__dict__.pop('product_ids', set())
+    if ingredient_ids or product_ids:
+        propagate_price_changes(ingredient_ids, product_ids)
@@ -0,0 +1,87 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+from django.utils import timezone
+
+from product.models import PriceHistory, PriceHistoryArchive, FinalProduct
+
+
+def as_of_timestamps(dates):
+    """Dates mean "at the end of that day"; datetimes are used as they are."""
+    timestamps = []
+    for value in dates:
+        if not isinstance(value, datetime.datetime):
+            value = datetime.datetime.combine(value, datetime.time.max)
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        timestamps.append(pd.Timestamp(value).tz_convert('UTC'))
+    return sorted(set(timestamps))
+
+
+def load_recipes():
+    recipes = pd.DataFrame.from_records(
+        FinalProduct.ingredients.through.objects.values_list(
+            'finalproduct_id', 'middleingredient__base_ingredient_id', 'middleingredient__unit_amount'),
+        columns=['product_id', 'ingredient_id', 'unit_amount'])
+    return recipes.astype({'product_id': 'int64', 'ingredient_id': 'int64', 'unit_amount': 'float64'})
+
+
+def load_price_history(ingredient_ids):
+    rows = []
+    # compacted rows live in the archive table
+    for model in (PriceHistory, PriceHistoryArchive):
+        rows += model.objects.filter(ingredient_id__in=ingredient_ids).order_by().values_list(
+            'ingredient_id', 'created_at', 'unit_price')
+    prices = pd.DataFrame.from_records(rows, columns=['ingredient_id', 'created_at', 'unit_price'])
+    prices['ingredient_id'] = prices['ingredient_id'].astype('int64')
+    prices['created_at'] = pd.to_datetime(prices['created_at'], utc=True)
+    prices['unit_price'] = prices['unit_price'].astype('float64')
+    return prices.sort_values('created_at', kind='stable')
+
+
+def prices_as_of(prices, ingredient_ids, timestamps):
+    """Matrix (timestamps x ingredients) of the price in effect at each timestamp, NaN before the first price."""
+    grid = pd.MultiIndex.from_product([timestamps, ingredient_ids], names=['as_of', 'ingredient_id']).to_frame(
+        index=False)
+    grid['as_of'] = pd.to_datetime(grid['as_of'], utc=True)
+    merged = pd.merge_asof(grid.sort_values('as_of', kind='stable'), prices, left_on='as_of', right_on='created_at',
+                           by='ingredient_id', direction='backward')
+    matrix = merged.pivot(index='as_of', columns='ingredient_id', values='unit_price')
+    return matrix.reindex(index=pd.DatetimeIndex(timestamps), columns=ingredient_ids)
+
+
+def menu_cost_as_of(dates):
+    """
+    Cost of every FinalProduct at each of the given dates, as a DataFrame indexed by date with one column per
+    product id. A product is NaN at a date where one of its ingredients had no price yet.
+    """
+    timestamps = as_of_timestamps(dates)
+    recipes = load_recipes()
+    product_ids = list(FinalProduct.objects.order_by('id').values_list('id', flat=True))
+    if recipes.empty or not timestamps:
+        return pd.DataFrame(0.0, index=pd.DatetimeIndex(timestamps), columns=product_ids)
+
+    ingredient_ids = sorted(recipes['ingredient_id'].unique())
+    matrix = prices_as_of(load_price_history(ingredient_ids), ingredient_ids, timestamps).to_numpy()
+
+    # one column per recipe line: the price of its ingredient at every date times its unit amount
+    line_prices = matrix[:, np.searchsorted(ingredient_ids, recipes['ingredient_id'].to_numpy())]
+    missing = np.isnan(line_prices)
+    contributions = np.where(missing, 0, np.floor(np.nan_to_num(line_prices) * recipes['unit_amount'].to_numpy()))
+
+    # sum the line contributions per (date, product) cell, numbering the cells of the dates x products result
+    product_index = np.searchsorted(product_ids, recipes['product_id'].to_numpy())
+    cells = (np.arange(len(timestamps))[:, None] * len(product_ids) + product_index).ravel()
+    shape = (len(timestamps), len(product_ids))
+
+    def per_product(weights):
+        return np.bincount(cells, weights=weights.ravel(), minlength=shape[0] * shape[1]).reshape(shape)
+
+    costs = per_product(contributions)
+    costs[per_product(missing) > 0] = np.nan
+    return pd.DataFrame(costs, index=pd.DatetimeIndex(timestamps), columns=product_ids)
+
+
+def menu_cost_between(start, end, freq='D'):
+    return menu_cost_as_of(pd.date_range(start, end, freq=freq).date)
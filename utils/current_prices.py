@@ -0,0 +1,74 @@
+import datetime
+
+from django.db.models import OuterRef, Subquery, F, FloatField, ExpressionWrapper
+
+from product.models import PrimaryIngredient, PriceHistory, FinalProduct, SellPriceHistory, FinalPriceHistory
+from utils.cost_cache import bump_product_versions
+
+
+def last_price_subquery():
+    return Subquery(PriceHistory.objects.filter(ingredient=OuterRef('pk')).order_by('-created_at').values(
+        'unit_price')[:1])
+
+
+def last_product_price_subquery(model):
+    return Subquery(model.objects.filter(final_product=OuterRef('pk'), sell_price__gt=0).order_by(
+        '-created_at').values('sell_price')[:1])
+
+
+def annotate_product_prices(queryset):
+    """Annotate FinalProducts with their latest cost and menu price, profit and margin (percent of menu price)."""
+    return queryset.annotate(
+        last_sell_price=last_product_price_subquery(SellPriceHistory),
+        last_final_price=last_product_price_subquery(FinalPriceHistory),
+    ).annotate(
+        profit=F('last_final_price') - F('last_sell_price'),
+    ).annotate(
+        margin=ExpressionWrapper(F('profit') * 100.0 / F('last_final_price'), output_field=FloatField()),
+    )
+
+
+def menu_price_as_of_subquery(**filters):
+    # menu prices registered up to a few seconds after the cost snapshot belong to the same edit
+    return Subquery(FinalPriceHistory.objects.filter(
+        final_product=OuterRef('final_product'),
+        created_at__lte=OuterRef('created_at') + datetime.timedelta(seconds=3),
+        **filters,
+    ).order_by('-created_at').values('sell_price')[:1])
+
+
+def annotate_sell_price_history(queryset):
+    """Annotate SellPriceHistory rows with the menu price in effect at each cost snapshot, profit and margin."""
+    return queryset.annotate(
+        menu_price=menu_price_as_of_subquery(),
+        positive_menu_price=menu_price_as_of_subquery(sell_price__gt=0),
+    ).annotate(
+        profit=F('positive_menu_price') - F('sell_price'),
+    ).annotate(
+        margin=ExpressionWrapper(F('profit') * 100.0 / F('positive_menu_price'), output_field=FloatField()),
+    )
+
+
+def _filter(queryset, ids):
+    return queryset if ids is None else queryset.filter(pk__in=ids)
+
+
+def sync_ingredient_prices(ingredient_ids=None):
+    """Refresh PrimaryIngredient.current_price from the latest PriceHistory rows (all ingredients if ids is None)."""
+    return _filter(PrimaryIngredient.objects.all(), ingredient_ids).update(
+        current_price=last_price_subquery())
+
+
+def sync_product_prices(product_ids=None):
+    """Refresh the current cost, menu price and profit columns of FinalProduct from the history tables."""
+    return _filter(FinalProduct.objects.all(), product_ids).update(
+        current_cost=last_product_price_subquery(SellPriceHistory),
+        current_menu_price=last_product_price_subquery(FinalPriceHistory),
+        current_profit=last_product_price_subquery(FinalPriceHistory) - last_product_price_subquery(SellPriceHistory),
+    )
+
+
+def rebuild_current_prices():
+    counts = sync_ingredient_prices(), sync_product_prices()
+    bump_product_versions()
+    return counts
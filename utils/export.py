@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+
+import xlsxwriter
+
+from product.models import FinalProduct
+from utils.cost_cache import compute_breakdowns
+from utils.utils import format_number_excel
+
+COLUMNS = ['نام محصول', 'واحد', 'نسبت مورد نیاز', 'قیمت نهایی']
+# bump when the sheet layout changes, so sheets rendered by an older layout are not reused
+LAYOUT_VERSION = 1
+
+
+def load_products(chunk_size=500):
+    """
+    (product, cost breakdown) pairs, with the breakdowns of each chunk of products computed with one query, next to
+    the product rows rather than from the cost cache, so an export never mixes totals and lines of different times.
+    """
+    chunk = []
+    for product in FinalProduct.objects.iterator(chunk_size=chunk_size):
+        chunk.append(product)
+        if len(chunk) == chunk_size:
+            yield from with_breakdowns(chunk)
+            chunk = []
+    yield from with_breakdowns(chunk)
+
+
+def with_breakdowns(products):
+    breakdowns = compute_breakdowns([product.pk for product in products]) if products else {}
+    return [(product, breakdowns[product.pk]) for product in products]
+
+
+def build_rows(product, breakdown):
+    rows = []
+    for ingredient in breakdown['ingredients']:
+        rows.append([ingredient['name'], ingredient['unit'], format_number_excel(ingredient['unit_amount']),
+                     format_number_excel(ingredient['unit_price'])])
+
+    rows.append([' ', ' ', ' ', ' '])
+    rows.append(['نام محصول نهایی', 'مجموع قیمت محاسبه شده', 'قیمت وارد شده در منو', 'سود یا زیان'])
+    rows.append([product.name, format_number_excel(product.current_cost),
+                 format_number_excel(product.current_menu_price), format_number_excel(product.current_profit)])
+    return rows
+
+
+def fingerprint(product, breakdown):
+    """Hash of everything a product sheet is rendered from."""
+    content = [LAYOUT_VERSION, product.name, product.current_cost, product.current_menu_price, product.current_profit,
+               breakdown['ingredients']]
+    return hashlib.sha1(json.dumps(content, ensure_ascii=False).encode()).hexdigest()
+
+
+def sheet_part(index):
+    return f'xl/worksheets/sheet{index + 1}.xml'
+
+
+def copy_reused_sheets(path, previous_path, reused):
+    """Replace the placeholder parts {new part: old part} of the workbook at path with the previous export's."""
+    fd, merged = tempfile.mkstemp(suffix='.xlsx', dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(path) as new, zipfile.ZipFile(previous_path) as old, \
+                zipfile.ZipFile(merged, 'w', zipfile.ZIP_DEFLATED) as out:
+            for info in new.infolist():
+                data = old.read(reused[info.filename]) if info.filename in reused else new.read(info)
+                out.writestr(info, data)
+        os.replace(merged, path)
+    except BaseException:
+        os.remove(merged)
+        raise
+
+
+def column_widths(rows):
+    widths = [len(column) for column in COLUMNS]
+    for row in rows:
+        for idx, value in enumerate(row):
+            if value is not None:
+                widths[idx] = max(widths[idx], len(str(value)))
+    return widths
+
+
+def export_menu(path, progress=None, previous=None):
+    """
+    Write every FinalProduct to its own sheet and return {product id: (fingerprint, sheet part)}.
+
+    previous is an earlier export as (path, {product id: (fingerprint, sheet part)}). Sheets whose fingerprint did
+    not change are copied from it instead of being rendered again; in constant_memory mode xlsxwriter writes strings
+    inline, so a sheet part does not depend on the rest of the workbook. The first sheet is always rendered because
+    it is the selected tab and its cell formats fix the style indexes of all the others.
+    """
+    previous_path, previous_sheets = previous or (None, {})
+    if previous_path and os.path.exists(previous_path):
+        with zipfile.ZipFile(previous_path) as old:
+            previous_parts = set(old.namelist())
+    else:
+        previous_parts = set()
+    sheets, reused = {}, {}
+
+    fd, workbook_path = tempfile.mkstemp(suffix='.xlsx', dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    workbook = xlsxwriter.Workbook(workbook_path, {'constant_memory': True})
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    cell_format = workbook.add_format(
+        {
+            'border': 1,
+            'align': 'center',
+            'valign': 'vcenter',
+            'text_wrap': True,
+            'font_size': 12,
+            'font_name': 'B Nazanin',
+            'num_format': '#,##0'
+        })
+
+    try:
+        total = FinalProduct.objects.count() if progress else 0
+        # Write data for each FinalProduct starting from the first sheet
+        for i, (product, breakdown) in enumerate(load_products()):
+            worksheet = workbook.add_worksheet(f'{product.name}' if i == 0 else f'{product.name}_{i}')
+            sheets[product.pk] = fingerprint(product, breakdown), sheet_part(i)
+            old_fingerprint, old_part = previous_sheets.get(product.pk, (None, None))
+            if i and old_fingerprint == sheets[product.pk][0] and old_part in previous_parts:
+                reused[sheet_part(i)] = old_part
+            else:
+                rows = build_rows(product, breakdown)
+                for idx, width in enumerate(column_widths(rows)):
+                    worksheet.set_column(idx, idx, width + 2, cell_format)
+                worksheet.write_row(0, 0, COLUMNS, header_format)
+                for row_idx, row in enumerate(rows, start=1):
+                    worksheet.write_row(row_idx, 0, row)
+            if progress:
+                progress(i + 1, total)
+        workbook.close()
+        if reused:
+            copy_reused_sheets(workbook_path, previous_path, reused)
+        os.replace(workbook_path, path)
+    finally:
+        if not workbook.fileclosed:
+            workbook.close()
+        if os.path.exists(workbook_path):
+            os.remove(workbook_path)
+    return sheets
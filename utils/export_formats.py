@@ -0,0 +1,92 @@
+import os
+import tempfile
+import zipfile
+
+from product.models import FinalProduct
+from utils.export import load_products
+from utils.long_format import to_csv, render_csv_chunk, render_bundle_chunk, render_table_chunk
+
+CHUNK_SIZE = 200
+
+
+def product_chunks(chunk_size=CHUNK_SIZE):
+    """(name, cost breakdown ingredients, menu price, profit) tuples in chunks."""
+    chunk = []
+    for product, breakdown in load_products():
+        chunk.append((product.name, breakdown['ingredients'], product.current_menu_price, product.current_profit))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rendered_chunks(render, progress=None):
+    """
+    render(chunk) for every chunk of products, in order, so the output can be streamed to disk chunk by chunk. Reading
+    the products and their breakdowns is most of the work, so rendering is not spread over processes.
+    """
+    total = FinalProduct.objects.count()
+    done = 0
+    for chunk in product_chunks():
+        done += len(chunk)
+        yield render(chunk)
+        if progress:
+            progress(done, total)
+
+
+def write_atomically(path, write):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def export_csv(path, progress=None, previous=None):
+    """One long-format CSV table with a row per product ingredient."""
+    def write(temp_path):
+        # utf-8-sig so that Excel shows the Persian names correctly
+        with open(temp_path, 'w', encoding='utf-8-sig', newline='') as f:
+            f.write(to_csv([], header=True))
+            for text in rendered_chunks(render_csv_chunk, progress):
+                f.write(text)
+
+    write_atomically(path, write)
+
+
+def export_csv_bundle(path, progress=None, previous=None):
+    """A zip archive with one long-format CSV file per product."""
+    def write(temp_path):
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            i = 0
+            for files in rendered_chunks(render_bundle_chunk, progress):
+                for name, text in files:
+                    archive.writestr(f'{name}.csv' if i == 0 else f'{name}_{i}.csv', text.encode('utf-8-sig'))
+                    i += 1
+
+    write_atomically(path, write)
+
+
+def export_parquet(path, progress=None, previous=None):
+    """One long-format Parquet table, written a row group per chunk of products. Needs pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise Exception('برای خروجی Parquet باید کتابخانه pyarrow نصب باشد!')
+
+    schema = pa.schema([('product', pa.string()), ('ingredient', pa.string()), ('unit', pa.string()),
+                        ('amount', pa.float64()), ('price', pa.int64()), ('cost', pa.int64()),
+                        ('menu_price', pa.int64()), ('profit', pa.int64())])
+
+    def write(temp_path):
+        with pq.ParquetWriter(temp_path, schema) as writer:
+            for rows in rendered_chunks(render_table_chunk, progress):
+                columns = list(zip(*rows))
+                writer.write_table(pa.table(columns, schema=schema) if columns else schema.empty_table())
+
+    write_atomically(path, write)
@@ -0,0 +1,56 @@
+import os
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.module_loading import import_string
+
+# Importers and exporters are referenced by dotted path and only imported when their format is used, so the heavy
+# spreadsheet and dataframe libraries stay out of Django's startup. Projects can add or replace formats with the
+# MENU_IMPORTERS / MENU_EXPORTERS settings.
+# An importer reads and checks a price list and returns its [(name, unit, price)] rows, see utils.importers.stage_rows.
+# An exporter may list the optional libraries it needs under 'requires'; it is not offered when one is missing.
+IMPORTERS = {
+    'xlsx': 'utils.importers.stage_excel',
+    'csv': 'utils.importers.stage_csv',
+}
+EXPORTERS = {
+    'xlsx': {'export': 'utils.export.export_menu', 'extension': 'xlsx'},
+    'csv_zip': {'export': 'utils.export_formats.export_csv_bundle', 'extension': 'zip'},
+    'csv': {'export': 'utils.export_formats.export_csv', 'extension': 'csv'},
+    'parquet': {'export': 'utils.export_formats.export_parquet', 'extension': 'parquet', 'requires': ['pyarrow']},
+}
+
+
+def importers():
+    return {**IMPORTERS, **getattr(settings, 'MENU_IMPORTERS', {})}
+
+
+def exporters():
+    return {**EXPORTERS, **getattr(settings, 'MENU_EXPORTERS', {})}
+
+
+def file_format(name):
+    return os.path.splitext(str(name))[1].lstrip('.').lower()
+
+
+def get_importer(name):
+    """The importer for a file, chosen by the file's extension."""
+    importer = importers().get(file_format(name))
+    if importer is None:
+        raise ValidationError('فرمت فایل وارد شده پشتیبانی نمی شود!')
+    return import_string(importer)
+
+
+def get_exporter(export_format):
+    return import_string(exporters()[export_format]['export'])
+
+
+def export_extension(export_format):
+    return exporters()[export_format]['extension']
+
+
+def export_available(export_format):
+    """Whether the libraries an export format needs are installed (looked up without importing them)."""
+    exporter = exporters().get(export_format)
+    return exporter is not None and all(find_spec(module) for module in exporter.get('requires', ()))
@@ -0,0 +1,233 @@
+import csv
+import io
+from contextlib import contextmanager
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from product.models import PrimaryIngredient, PriceHistory, Unit, StagedPrice, FinalProduct
+from utils.cost_graph import propagate_price_changes, get_cost_graph
+from utils.current_prices import sync_ingredient_prices
+from utils.text import normalize_name
+from utils.utils import persian_to_english_number
+
+PRICE_LIST_SHEET = 'Page 1'
+# both formats have the price list's columns: row number, name, unit, price
+NAME_COLUMN = 1
+MAX_REPORTED_ERRORS = 20
+MAX_NAME_LENGTH = PrimaryIngredient._meta.get_field('name').max_length
+MAX_UNIT_LENGTH = Unit._meta.get_field('title').max_length
+
+
+@contextmanager
+def open_binary(imported_file):
+    """A stored file (or anything with a path) is opened by path; an upload is read in place and rewound after."""
+    path = getattr(imported_file, 'path', None)
+    if path:
+        with open(path, 'rb') as f:
+            yield f
+    else:
+        imported_file.seek(0)
+        try:
+            yield imported_file
+        finally:
+            imported_file.seek(0)
+
+
+def excel_rows(imported_file):
+    # imported here, the admin imports the staging helpers of this module at startup
+    from openpyxl.reader.excel import load_workbook
+
+    with open_binary(imported_file) as f:
+        wb = load_workbook(f, read_only=True)
+        try:
+            if PRICE_LIST_SHEET not in wb.sheetnames:
+                raise ValidationError(f'برگه «{PRICE_LIST_SHEET}» در فایل اکسل وجود ندارد!')
+            for number, row in enumerate(wb[PRICE_LIST_SHEET].iter_rows(min_row=3, values_only=True), start=3):
+                yield number, row[NAME_COLUMN:NAME_COLUMN + 3]
+        finally:
+            wb.close()
+
+
+def csv_rows(imported_file):
+    with open_binary(imported_file) as f:
+        text = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+        try:
+            # the first line is the header
+            for number, row in enumerate(csv.reader(text), start=1):
+                if number > 1:
+                    yield number, row[NAME_COLUMN:NAME_COLUMN + 3]
+        finally:
+            # leave the file open for the storage that saves the upload
+            text.detach()
+
+
+def parse_price(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, int):
+        return value
+    return int(persian_to_english_number(str(value).strip()).replace(',', ''))
+
+
+def stage_rows(numbered_rows):
+    """
+    Check every (row number, (name, unit, price)) of a price list and return the [(name, unit, price)] batch to
+    import. Blank rows are skipped; all the problems are raised together, one message per row.
+    """
+    rows, errors = [], []
+    for number, values in numbered_rows:
+        name, unit, price = (list(values) + [None] * 3)[:3]
+        name, unit = (str(value).strip() if value is not None else '' for value in (name, unit))
+        if not name and not unit and price in (None, ''):
+            continue
+        row_errors = []
+        if not name:
+            row_errors.append('نام کالا وارد نشده است')
+        elif len(name) > MAX_NAME_LENGTH:
+            row_errors.append(f'نام کالا بیشتر از {MAX_NAME_LENGTH} حرف است')
+        if not unit:
+            row_errors.append('واحد وارد نشده است')
+        elif len(unit) > MAX_UNIT_LENGTH:
+            row_errors.append(f'واحد بیشتر از {MAX_UNIT_LENGTH} حرف است')
+        try:
+            price = parse_price(price)
+            if price < 0:
+                raise ValueError
+        except (ValueError, TypeError):
+            row_errors.append(f'قیمت «{price if price is not None else ""}» عدد صحیح و مثبت نیست')
+        if row_errors:
+            errors.append(f'ردیف {number}: {"، ".join(row_errors)}')
+        else:
+            rows.append((name, unit, price))
+
+    if len(errors) > MAX_REPORTED_ERRORS:
+        errors = errors[:MAX_REPORTED_ERRORS] + [f'و {len(errors) - MAX_REPORTED_ERRORS} ردیف نادرست دیگر']
+    if errors:
+        raise ValidationError(errors)
+    if not rows:
+        raise ValidationError('فایل وارد شده هیچ قیمتی ندارد!')
+    return rows
+
+
+def stage_file(read_rows, imported_file, format_error):
+    try:
+        return stage_rows(read_rows(imported_file))
+    except ValidationError:
+        raise
+    except Exception:
+        raise ValidationError(format_error)
+
+
+def stage_excel(imported_file):
+    return stage_file(excel_rows, imported_file, 'فایل اکسل وارد شده در فرمت درستی نمی باشد!')
+
+
+def stage_csv(imported_file):
+    return stage_file(csv_rows, imported_file, 'فایل CSV وارد شده در فرمت درستی نمی باشد!')
+
+
+def save_staged(menu, rows):
+    """Keep a checked batch with its menu, so the import job does not have to read the file again."""
+    StagedPrice.objects.filter(menu=menu).delete()
+    StagedPrice.objects.bulk_create(
+        [StagedPrice(menu=menu, name=name, unit=unit, unit_price=price) for name, unit, price in rows])
+
+
+def load_staged(menu):
+    return list(StagedPrice.objects.filter(menu=menu).values_list('name', 'unit', 'unit_price'))
+
+
+def commit_rows(rows):
+    with transaction.atomic():
+        return bulk_import_prices(rows)
+
+
+def import_from_excel(imported_file):
+    return commit_rows(stage_excel(imported_file))
+
+
+def price_changes(rows):
+    """
+    Compare a staged batch with the current prices, with one query. Returns the new ingredients as
+    {name: (unit, price)}, the existing ingredients whose price changes as {ingredient: new price} and the number of
+    rows that change nothing. When a name repeats, its last row counts.
+    """
+    latest = {name: (unit, price) for name, unit, price in rows}
+    ingredients = {}
+    for ingredient in PrimaryIngredient.objects.only('id', 'name', 'current_price').order_by('created_at'):
+        ingredients.setdefault(ingredient.name, ingredient)
+
+    new, changed = {}, {}
+    for name, (unit, price) in latest.items():
+        ingredient = ingredients.get(name)
+        if ingredient is None:
+            new[name] = unit, price
+        elif ingredient.current_price != price:
+            changed[ingredient] = price
+    return new, changed, len(rows) - len(new) - len(changed)
+
+
+def bulk_import_prices(rows):
+    """Write the prices of a staged batch that differ from the current ones, and return its price_changes()."""
+    new, changed, unchanged = price_changes(rows)
+
+    units = {unit.title: unit for unit in Unit.objects.all()}
+    new_units = {title: Unit(title=title) for title, _ in new.values() if title not in units}
+    Unit.objects.bulk_create(new_units.values())
+    units.update(new_units)
+
+    new_ingredients = [PrimaryIngredient(name=name, unit=units[title], normalized_name=normalize_name(name))
+                       for name, (title, _) in new.items()]
+    PrimaryIngredient.objects.bulk_create(new_ingredients)
+
+    prices = {**{ingredient: new[ingredient.name][1] for ingredient in new_ingredients}, **changed}
+    PriceHistory.objects.bulk_create(
+        [PriceHistory(ingredient=ingredient, unit_price=price) for ingredient, price in prices.items()])
+    ingredient_ids = {ingredient.pk for ingredient in prices}
+    sync_ingredient_prices(ingredient_ids)
+    propagate_price_changes(ingredient_ids)
+    return new, changed, unchanged
+
+
+def diff_report(rows):
+    """
+    What importing a staged batch would change, without writing anything: the new ingredients, the changed prices
+    with their percent change, and the cost and profit before and after of every product whose cost moves.
+    """
+    new, changed, unchanged = price_changes(rows)
+    report = {
+        'new_ingredients': [{'name': name, 'unit': unit, 'price': price} for name, (unit, price) in new.items()],
+        'changed_prices': [{
+            'name': ingredient.name,
+            'old_price': ingredient.current_price,
+            'new_price': price,
+            'percent': round((price - ingredient.current_price) / ingredient.current_price * 100, 1)
+            if ingredient.current_price else None,
+        } for ingredient, price in changed.items()],
+        'unchanged': unchanged,
+        'products': [],
+    }
+    if not changed:
+        return report
+
+    # the same per line rounding as propagate_price_changes, on a copy of the cost graph
+    graph = get_cost_graph().copy()
+    for ingredient, price in changed.items():
+        graph.set_price(ingredient.pk, price)
+    ingredient_ids = {ingredient.pk for ingredient in changed}
+    ingredient_ids |= set(graph.resolve(ingredient_ids))
+    product_ids = {product_id for ingredient_id in ingredient_ids for product_id in graph.products_using(ingredient_id)}
+    for product in FinalProduct.objects.filter(pk__in=product_ids).order_by('name'):
+        new_cost = graph.product_cost(product.pk)
+        if not new_cost or new_cost == product.current_cost:
+            continue
+        menu_price = product.current_menu_price
+        report['products'].append({
+            'name': product.name,
+            'old_cost': product.current_cost or 0,
+            'new_cost': new_cost,
+            'old_profit': product.current_profit,
+            'new_profit': menu_price - new_cost if menu_price is not None else None,
+        })
+    return report
@@ -0,0 +1,110 @@
+import functools
+import re
+import threading
+import time
+from collections import deque, Counter
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+_records = deque(maxlen=getattr(settings, 'INSTRUMENTATION_BUFFER_SIZE', 500))
+_records_lock = threading.Lock()
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'IN \((?:\?, )*\?\)')
+
+
+def normalize_sql(sql):
+    sql = _literals.sub('?', sql).replace('%s', '?')
+    return _in_lists.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    """Collects the SQL run on the default connection while active (connection.execute_wrapper)."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, repr(params), time.perf_counter() - started))
+
+    def summary(self):
+        exact = Counter((sql, params) for sql, params, _ in self.queries)
+        patterns = Counter(normalize_sql(sql) for sql, _, _ in self.queries)
+        threshold = getattr(settings, 'INSTRUMENTATION_N_PLUS_ONE_THRESHOLD', 5)
+        return {
+            'queries': len(self.queries),
+            'query_time': round(sum(duration for _, _, duration in self.queries), 4),
+            'duplicates': sum(count - 1 for count in exact.values()),
+            'n_plus_one': [(pattern, count) for pattern, count in patterns.most_common() if count >= threshold],
+        }
+
+
+def instrumentation_enabled():
+    return getattr(settings, 'INSTRUMENTATION_ENABLED', False)
+
+
+def measure(kind, name, func, *args, **kwargs):
+    recorder = QueryRecorder()
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(recorder):
+            return func(*args, **kwargs)
+    finally:
+        record = {'kind': kind, 'name': name, 'wall_time': round(time.perf_counter() - started, 4),
+                  'at': timezone.now(), **recorder.summary()}
+        with _records_lock:
+            _records.append(record)
+
+
+def instrumented_receiver(func):
+    """Record query count, query time, duplicates and wall time of every call of a signal receiver."""
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not instrumentation_enabled():
+            return func(*args, **kwargs)
+        return measure('signal', name, func, *args, **kwargs)
+
+    return wrapper
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not instrumentation_enabled():
+            return self.get_response(request)
+        return measure('request', f'{request.method} {request.path}', self.get_response, request)
+
+
+def get_records():
+    with _records_lock:
+        return list(_records)
+
+
+def clear_records():
+    with _records_lock:
+        _records.clear()
+
+
+def worst_offenders(records, key, limit=20):
+    return sorted(records, key=lambda record: record[key], reverse=True)[:limit]
+
+
+def n_plus_one_patterns(records):
+    """N+1 query patterns seen in the records with where they happened, most repeated first."""
+    patterns = {}
+    for record in records:
+        for pattern, count in record['n_plus_one']:
+            seen = patterns.setdefault(pattern, {'pattern': pattern, 'max_count': 0, 'names': set()})
+            seen['max_count'] = max(seen['max_count'], count)
+            seen['names'].add(record['name'])
+    return sorted(patterns.values(), key=lambda seen: seen['max_count'], reverse=True)
@@ -0,0 +1,120 @@
+import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+from jalali_date import date2jalali
+
+from product.models import Job, Menu, MenuSheet, StagedPrice
+from utils.formats import get_importer, get_exporter, export_extension
+from utils.importers import load_staged, commit_rows
+
+IMPORT_SHARE = 20
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.JOB_WORKERS, thread_name_prefix='menu-job')
+        return _executor
+
+
+def enqueue_menu_job(menu):
+    job = Job.objects.create(menu=menu)
+    transaction.on_commit(wake_workers)
+    return job
+
+
+def wake_workers():
+    if settings.JOB_WORKERS:
+        get_executor().submit(run_pending_jobs)
+    else:
+        run_pending_jobs()
+
+
+def requeue_stale_jobs():
+    """Put jobs left running by a worker that died (started more than JOB_TIMEOUT seconds ago) back in the queue."""
+    started_before = timezone.now() - datetime.timedelta(seconds=settings.JOB_TIMEOUT)
+    return Job.objects.filter(status=Job.StatusChoices.RUNNING, started_at__lt=started_before).update(
+        status=Job.StatusChoices.QUEUED, started_at=None, progress=0)
+
+
+def claim_next_job():
+    requeue_stale_jobs()
+    for job in Job.objects.filter(status=Job.StatusChoices.QUEUED).order_by('created_at'):
+        claimed = Job.objects.filter(pk=job.pk, status=Job.StatusChoices.QUEUED).update(
+            status=Job.StatusChoices.RUNNING, started_at=timezone.now())
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_pending_jobs():
+    in_worker = threading.current_thread() is not threading.main_thread()
+    try:
+        while job := claim_next_job():
+            run_job(job)
+    finally:
+        if in_worker:
+            close_old_connections()
+
+
+def set_progress(job, progress):
+    if progress != job.progress:
+        job.progress = progress
+        Job.objects.filter(pk=job.pk).update(progress=progress)
+
+
+def previous_export(menu):
+    """(path, {product id: (fingerprint, sheet part)}) of the latest other export, for an incremental export."""
+    previous = Menu.objects.exclude(pk=menu.pk).exclude(file='').filter(
+        file__isnull=False, sheets__isnull=False).order_by('-created_at').first()
+    if previous is None:
+        return None
+    sheets = {product_id: (fingerprint, part) for product_id, fingerprint, part in
+              previous.sheets.values_list('final_product_id', 'fingerprint', 'part')}
+    return os.path.join(settings.MEDIA_ROOT, previous.file.name), sheets
+
+
+def run_job(job):
+    menu = job.menu
+    try:
+        export_start = 0
+        if menu.imported_file:
+            # rows staged when the upload was checked; menus saved outside the admin are read from the file
+            rows = load_staged(menu) or get_importer(menu.imported_file.name)(menu.imported_file)
+            commit_rows(rows)
+            StagedPrice.objects.filter(menu=menu).delete()
+            export_start = IMPORT_SHARE
+            set_progress(job, export_start)
+
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        # one file per menu: the sheets of a menu are reused by later exports, so no other menu may overwrite them
+        name = f'menu_{str(date2jalali(menu.created_at.date()))}_{menu.pk}.{export_extension(menu.export_format)}'
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        previous = previous_export(menu) if menu.export_format == Menu.ExportFormatChoices.XLSX else None
+        sheets = get_exporter(menu.export_format)(path, progress=lambda done, total: set_progress(
+            job, export_start + (100 - export_start) * done // total), previous=previous)
+        with transaction.atomic():
+            Menu.objects.filter(id=menu.id).update(file=os.path.relpath(path, settings.MEDIA_ROOT))
+            MenuSheet.objects.filter(menu=menu).delete()
+            # only the xlsx export has sheets that a later export can reuse
+            MenuSheet.objects.bulk_create(
+                [MenuSheet(menu=menu, final_product_id=product_id, fingerprint=fingerprint, part=part)
+                 for product_id, (fingerprint, part) in (sheets or {}).items()])
+
+        job.status = Job.StatusChoices.DONE
+        job.progress = 100
+    except Exception as e:
+        job.status = Job.StatusChoices.FAILED
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'error', 'finished_at', 'updated_at'])
+    return job
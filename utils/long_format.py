@@ -0,0 +1,33 @@
+import csv
+import io
+
+# Rendering of the long-format export tables from (name, cost breakdown ingredients, menu price, profit) tuples.
+LONG_COLUMNS = ['product', 'ingredient', 'unit', 'amount', 'price', 'cost', 'menu_price', 'profit']
+
+
+def long_rows(name, ingredients, menu_price, profit):
+    if not ingredients:
+        return [[name, None, None, None, None, None, menu_price, profit]]
+    return [[name, ingredient['name'], ingredient['unit'], ingredient['unit_amount'], ingredient['unit_price'],
+             ingredient['cost'], menu_price, profit] for ingredient in ingredients]
+
+
+def to_csv(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(LONG_COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def render_table_chunk(chunk):
+    return [row for product in chunk for row in long_rows(*product)]
+
+
+def render_csv_chunk(chunk):
+    return to_csv(render_table_chunk(chunk))
+
+
+def render_bundle_chunk(chunk):
+    return [(name, to_csv(long_rows(name, *rest), header=True)) for name, *rest in chunk]
@@ -0,0 +1,102 @@
+import numpy as np
+
+from product.models import PrimaryIngredient, FinalProduct
+
+
+class RecipeMatrix:
+    """
+    Ingredient x product recipe matrix built from FinalProduct.ingredients / MiddleIngredient.unit_amount, plus the
+    ingredient x ingredient matrix of composite ingredients (PrimaryIngredient.related_ingredient).
+
+    Matrices are dense NumPy arrays filled from (row, column, amount) triplets; scipy is not a dependency of the
+    project and a few thousand ingredients by a few thousand products still fits comfortably in memory.
+    """
+
+    def __init__(self):
+        ingredients = list(PrimaryIngredient.objects.order_by('id').values_list('id', 'current_price'))
+        products = list(FinalProduct.objects.order_by('id').values_list('id', 'current_menu_price'))
+        self.ingredient_ids = np.array([ingredient_id for ingredient_id, _ in ingredients], dtype=np.int64)
+        self.product_ids = np.array([product_id for product_id, _ in products], dtype=np.int64)
+        self.prices = np.array([price or 0 for _, price in ingredients], dtype=np.float64)
+        self.menu_prices = np.array([np.nan if price is None else price for _, price in products], dtype=np.float64)
+
+        self.recipes = np.zeros((len(self.ingredient_ids), len(self.product_ids)))
+        lines = FinalProduct.ingredients.through.objects.values_list(
+            'middleingredient__base_ingredient_id', 'finalproduct_id', 'middleingredient__unit_amount')
+        self._fill(self.recipes, lines, self.product_ids)
+
+        self.composites = np.zeros((len(self.ingredient_ids), len(self.ingredient_ids)))
+        lines = PrimaryIngredient.related_ingredient.through.objects.values_list(
+            'middleingredient__base_ingredient_id', 'primaryingredient_id', 'middleingredient__unit_amount')
+        self._fill(self.composites, lines, self.ingredient_ids)
+        self.composite_columns = np.flatnonzero(self.composites.any(axis=0))
+
+    def _fill(self, matrix, lines, column_ids):
+        lines = np.array(list(lines), dtype=np.float64).reshape(-1, 3)
+        rows = np.searchsorted(self.ingredient_ids, lines[:, 0].astype(np.int64))
+        columns = np.searchsorted(column_ids, lines[:, 1].astype(np.int64))
+        np.add.at(matrix, (rows, columns), lines[:, 2])
+
+    def ingredient_index(self, ingredient_id):
+        index = np.searchsorted(self.ingredient_ids, ingredient_id)
+        if index >= len(self.ingredient_ids) or self.ingredient_ids[index] != ingredient_id:
+            raise KeyError(ingredient_id)
+        return index
+
+    def scenario_prices(self, scenarios):
+        """Price matrix (scenarios x ingredients) with each scenario's factors and override prices applied."""
+        prices = np.tile(self.prices, (len(scenarios), 1))
+        fixed = np.zeros(prices.shape, dtype=bool)
+        for row, scenario in enumerate(scenarios):
+            for ingredient_id, factor in scenario.get('factors', {}).items():
+                prices[row, self.ingredient_index(ingredient_id)] *= factor
+            for ingredient_id, price in scenario.get('prices', {}).items():
+                index = self.ingredient_index(ingredient_id)
+                prices[row, index] = price
+                fixed[row, index] = True
+
+        # composite ingredients are re-priced from their recipes, one level per pass
+        columns = self.composite_columns
+        for _ in range(len(columns)):
+            resolved = np.where(fixed[:, columns], prices[:, columns], prices @ self.composites[:, columns])
+            if np.array_equal(resolved, prices[:, columns]):
+                break
+            prices[:, columns] = resolved
+        return prices
+
+    def simulate(self, scenarios):
+        costs = self.scenario_prices(scenarios) @ self.recipes
+        return SimulationResult(self, [scenario.get('name', str(i)) for i, scenario in enumerate(scenarios)], costs)
+
+
+class SimulationResult:
+    def __init__(self, matrix, names, costs):
+        self.names = names
+        self.product_ids = matrix.product_ids
+        self.menu_prices = matrix.menu_prices
+        self.costs = costs
+        self.profits = matrix.menu_prices - costs
+
+    def cost(self, scenario, product_id):
+        return self.costs[self.names.index(scenario), np.searchsorted(self.product_ids, product_id)]
+
+    def profit(self, scenario, product_id):
+        return self.profits[self.names.index(scenario), np.searchsorted(self.product_ids, product_id)]
+
+    def summary(self):
+        return [{
+            'scenario': name,
+            'total_cost': float(self.costs[row].sum()),
+            'loss_making': int((self.profits[row] < 0).sum()),
+        } for row, name in enumerate(self.names)]
+
+
+def simulate(scenarios):
+    """
+    Cost and profit of every FinalProduct under each scenario, without writing anything to the database.
+
+    A scenario is a dict with an optional name, "factors" ({ingredient id: multiplier}, e.g. 1.15 for +15%) and
+    "prices" ({ingredient id: override price}). Costs come from matrix products, so unlike the stored costs they are
+    not rounded down per recipe line.
+    """
+    return RecipeMatrix().simulate(scenarios)
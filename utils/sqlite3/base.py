@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The SQLite backend with settings.SQLITE_PRAGMAS (WAL journal, busy timeout, ...) applied to every connection,
+    and transactions started with BEGIN IMMEDIATE. In WAL mode a deferred transaction that reads and then writes
+    cannot wait for a writer that committed in between and fails with "database is locked" at once; an immediate
+    one takes the write lock up front, waiting up to the busy timeout for it.
+    """
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,139 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction, OperationalError
+from django.db.models.signals import post_save
+
+from product.models import PrimaryIngredient, PriceHistory, SellPriceHistory
+from utils.cost_graph import prices_propagated
+from utils.current_prices import rebuild_current_prices
+from utils.export import export_menu
+
+writer = threading.local()
+
+
+def collect_written_row(sender, instance, created, **kwargs):
+    """Remember the history rows saved by writer threads."""
+    if created and getattr(writer, 'written', None) is not None:
+        writer.written.append((sender, instance.pk))
+
+
+def collect_propagated_rows(sender, rows, **kwargs):
+    """Remember the composite prices and product costs the price propagation of writer threads writes."""
+    if getattr(writer, 'written', None) is not None:
+        writer.written.extend((type(row), row.pk) for row in rows)
+
+
+def is_lock_error(error):
+    return 'locked' in str(error) or 'deadlock' in str(error)
+
+
+def write_prices(ingredient_ids, deadline, seed, written):
+    """
+    Admin-style price edits until the deadline: read an ingredient and add a PriceHistory row at its current price
+    in one transaction, like saving the PriceHistory change form. Every history row the thread saves is added to
+    `written` as a (model, id) pair. Returns (written row ids, latencies, lock errors).
+    """
+    rnd = random.Random(seed)
+    ids, latencies, lock_errors = [], [], 0
+    writer.written = written
+    try:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    ingredient = PrimaryIngredient.objects.get(pk=rnd.choice(ingredient_ids))
+                    ids.append(PriceHistory.objects.create(
+                        ingredient=ingredient, unit_price=ingredient.current_price).pk)
+            except OperationalError as e:
+                if not is_lock_error(e):
+                    raise
+                lock_errors += 1
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.written = None
+        connection.close()
+    return ids, latencies, lock_errors
+
+
+def export_menus(deadline):
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    exports = 0
+    try:
+        while time.monotonic() < deadline:
+            export_menu(path)
+            exports += 1
+    finally:
+        os.remove(path)
+        connection.close()
+    return exports
+
+
+def delete_written_rows(written):
+    """
+    Delete the collected rows, prices first, since deleting a price propagates it again and the cost history rows
+    that writes are collected too.
+    """
+    writer.written = written
+    try:
+        for model in (PriceHistory, SellPriceHistory):
+            ids = [pk for sender, pk in written if sender is model]
+            for start in range(0, len(ids), 500):
+                model.objects.filter(pk__in=ids[start:start + 500]).delete()
+    finally:
+        writer.written = None
+    rebuild_current_prices()
+
+
+def run_stress(writers=4, seconds=10.0, seed=0, scratch=False):
+    """
+    Run `writers` threads of admin-style price edits against menu exports running back to back, for `seconds`, and
+    report the write throughput and the "database is locked" errors. The prices written are the current ones, but
+    their propagation may still write product costs and composite prices, so the history rows the writer threads
+    saved are deleted afterwards and the current prices rebuilt. Only runs on a database the caller marks as a
+    scratch copy.
+    """
+    if not scratch:
+        raise ValueError('The stress test writes to the database; run it only on a scratch copy.')
+    ingredient_ids = list(PrimaryIngredient.objects.filter(current_price__isnull=False).values_list('id', flat=True))
+    if not ingredient_ids:
+        raise ValueError('There are no ingredients with a price to write prices for.')
+
+    post_save.connect(collect_written_row, dispatch_uid='stress_collect_written_row')
+    prices_propagated.connect(collect_propagated_rows, dispatch_uid='stress_collect_propagated_rows')
+    deadline = time.monotonic() + seconds
+    started = time.perf_counter()
+    written = []
+    try:
+        with ThreadPoolExecutor(max_workers=writers + 1) as executor:
+            exports = executor.submit(export_menus, deadline)
+            results = [executor.submit(write_prices, ingredient_ids, deadline, seed + i, written)
+                       for i in range(writers)]
+            results = [future.result() for future in results]
+            exports = exports.result()
+        elapsed = time.perf_counter() - started
+    finally:
+        try:
+            delete_written_rows(written)
+        finally:
+            post_save.disconnect(dispatch_uid='stress_collect_written_row')
+            prices_propagated.disconnect(dispatch_uid='stress_collect_propagated_rows')
+
+    ids = [pk for written, _, _ in results for pk in written]
+    latencies = sorted(latency for _, written, _ in results for latency in written)
+    return {
+        'vendor': connection.vendor,
+        'writers': writers,
+        'seconds': round(elapsed, 2),
+        'writes': len(ids),
+        'writes_per_second': round(len(ids) / elapsed, 1),
+        'lock_errors': sum(lock_errors for _, _, lock_errors in results),
+        'exports': exports,
+        'p95_write_latency': round(latencies[int(len(latencies) * .95)], 4) if latencies else None,
+        'max_write_latency': round(latencies[-1], 4) if latencies else None,
+    }
@@ -0,0 +1,17 @@
+import re
+
+NAME_FOLDING = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', 'ـ': None,
+    '‌': ' ', '‏': None, '‎': None,
+    **{persian: str(digit) for digit, persian in enumerate('۰۱۲۳۴۵۶۷۸۹')},
+    **{arabic: str(digit) for digit, arabic in enumerate('٠١٢٣٤٥٦٧٨٩')},
+})
+_spaces = re.compile(r'\s+')
+
+# upper bound for prefix range lookups: name__gte=prefix, name__lt=prefix + PREFIX_END
+PREFIX_END = '￿'
+
+
+def normalize_name(text):
+    """Fold Arabic/Persian letter variants, half-spaces and digits so spelling variants of a name compare equal."""
+    return _spaces.sub(' ', (text or '').translate(NAME_FOLDING)).strip().lower()
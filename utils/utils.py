@@ -1,32 +1,20 @@
-import re
-
-import pandas as pd
-from django.core.exceptions import ValidationError
-from django.core.files.storage import default_storage
-from openpyxl.reader.excel import load_workbook
-
-from product.models import FinalProduct, FinalPriceHistory, SellPriceHistory, PrimaryIngredient, PriceHistory, Unit
+from product.models import PrimaryIngredient
 
 
 def get_last_final_price(product):
-    if FinalPriceHistory.objects.filter(final_product=product, sell_price__gt=0).first():
-        return FinalPriceHistory.objects.filter(final_product=product, sell_price__gt=0).first().sell_price
+    return product.current_menu_price
 
 
 def get_last_sell_price(product):
-    if SellPriceHistory.objects.filter(final_product=product, sell_price__gt=0).first():
-        return SellPriceHistory.objects.filter(final_product=product, sell_price__gt=0).first().sell_price
+    return product.current_cost
 
 
 def get_profit(product):
-    final_price_history_qs = FinalPriceHistory.objects.filter(final_product=product, sell_price__gt=0)
-    sell_price_history_qs = SellPriceHistory.objects.filter(final_product=product, sell_price__gt=0)
-    if final_price_history_qs.exists() and sell_price_history_qs.exists():
-        return final_price_history_qs.first().sell_price - sell_price_history_qs.first().sell_price
+    return product.current_profit
 
 
 def get_last_price_history(primary_product: PrimaryIngredient):
-    return PriceHistory.objects.filter(ingredient=primary_product).first().unit_price
+    return primary_product.current_price
 
 
 def format_number_excel(x):
@@ -38,92 +26,6 @@ def format_number_excel(x):
         return x
 
 
-def create_data(final_product: FinalProduct):
-    data = pd.DataFrame({
-        'نام محصول': [i.base_ingredient.name for i in final_product.ingredients.all()],
-        'واحد': [i.base_ingredient.unit.title for i in final_product.ingredients.all()],
-        'نسبت مورد نیاز': [i.unit_amount for i in final_product.ingredients.all()],
-        'قیمت نهایی': [get_last_price_history(i.base_ingredient) for i in final_product.ingredients.all()]
-    })
-
-    # Format numbers with thousands separators
-    data['نسبت مورد نیاز'] = data['نسبت مورد نیاز'].apply(format_number_excel)
-    data['قیمت نهایی'] = data['قیمت نهایی'].apply(format_number_excel)
-
-    empty_row = pd.DataFrame({
-        'نام محصول': [' '],
-        'واحد': [' '],
-        'نسبت مورد نیاز': [' '],
-        'قیمت نهایی': [' ']
-    })
-
-    titles_row = pd.DataFrame({
-        'نام محصول': ['نام محصول نهایی'],
-        'واحد': ['مجموع قیمت محاسبه شده'],
-        'نسبت مورد نیاز': ['قیمت وارد شده در منو'],
-        'قیمت نهایی': ['سود یا زیان']
-    })
-
-    additional_calculation = pd.DataFrame({
-        'نام محصول': [final_product.name],
-        'واحد': [get_last_sell_price(final_product)],
-        'نسبت مورد نیاز': [get_last_final_price(final_product)],
-        'قیمت نهایی': [get_profit(final_product)]
-    })
-
-    # Format numbers with thousands separators
-    additional_calculation['واحد'] = additional_calculation['واحد'].apply(format_number_excel)
-    additional_calculation['نسبت مورد نیاز'] = additional_calculation['نسبت مورد نیاز'].apply(format_number_excel)
-    additional_calculation['قیمت نهایی'] = additional_calculation['قیمت نهایی'].apply(format_number_excel)
-
-    data = pd.concat([data, empty_row, titles_row, additional_calculation], ignore_index=True)
-
-    # HTML(style)
-
-    return data
-
-
-def import_from_excel(imported_file):
-    try:
-        wb = load_workbook(imported_file.path)
-        ws = wb['Page 1']
-        all_rows = list(ws.rows)
-        for row in range(2, len(all_rows)):
-            product_name = all_rows[row][1].value
-            product_unit = all_rows[row][2].value
-            product_unit_price = int(all_rows[row][3].value)
-            if not PrimaryIngredient.objects.filter(name=product_name).exists():
-                PrimaryIngredient.objects.create(name=product_name,
-                                                 unit=Unit.objects.get_or_create(title=product_unit)[0])
-            PriceHistory.objects.create(unit_price=product_unit_price,
-                                        ingredient=PrimaryIngredient.objects.get(name=product_name))
-    except ValidationError as v:
-        raise ValidationError(v)
-    except Exception as e:
-        raise Exception('فایل اکسل وارد شده در فرمت درستی نمی باشد!')
-
-
-def validate_excel(imported_file):
-    try:
-        name = default_storage.save(imported_file.name, imported_file)
-        path = default_storage.path(name)
-
-        wb = load_workbook(path)
-        ws = wb['Page 1']
-        all_rows = list(ws.rows)
-        for row in range(2, len(all_rows)):
-            product_name = all_rows[row][1].value
-            product_unit = all_rows[row][2].value
-            product_unit_price = int(all_rows[row][3].value)
-        default_storage.delete(path)
-    except Exception as e:
-        try:
-            default_storage.delete(path)
-        except Exception:
-            pass
-        raise Exception('فایل اکسل وارد شده در فرمت درستی نمی باشد!')
-
-
 def persian_to_english_number(persian_number):
     persian_to_english = {'۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4', '۵': '5', '۶': '6', '۷': '7', '۸': '8',
                           '۹': '9'}